@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_caches():
+    """Тесты работают со своим файлом кэша, а не с общим."""
+    from core.test_runner import temporary_caches
+    with temporary_caches():
+        yield
+
+
+@pytest.fixture(scope='session', autouse=True)
+def discard_counters(django_db_setup):
+    """Приращения счётчиков не сбрасываются после удаления тестовой базы."""
+    yield
+    from core import counters
+    counters.discard_all()
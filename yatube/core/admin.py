@@ -0,0 +1,52 @@
+from django.contrib import admin, messages
+
+from . import deletion
+from .models import DeletionTask, Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'run_after',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('dedup_key',)
+    empty_value_display = '-пусто-'
+
+
+class DeletionTaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'content_type',
+        'object_repr',
+        'status',
+        'step',
+        'processed',
+        'created',
+        'finished',
+    )
+    list_filter = ('status', 'content_type')
+    empty_value_display = '-пусто-'
+
+
+class BackgroundDeleteMixin:
+    """Удаление из админки через core.deletion вместо delete()."""
+
+    def delete_model(self, request, obj):
+        deletion.schedule(obj)
+        self.message_user(
+            request,
+            f'«{obj}» скрыт и будет удалён в фоне',
+            messages.INFO,
+        )
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            deletion.schedule(obj)
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(DeletionTask, DeletionTaskAdmin)
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .counters import flush_due
+        request_finished.connect(flush_due, dispatch_uid='core.flush_due')
@@ -0,0 +1,243 @@
+"""Защита кэша от одновременного пересчёта одного ключа.
+
+Значение хранится вместе со временем расчёта и моментом устаревания.
+Ключ пересчитывается досрочно с вероятностью, которая растёт к концу
+срока (вероятностное раннее устаревание), поэтому обновления горячих
+ключей разносятся во времени. Пересчёт выполняет только тот, кто
+захватил блокировку в кэше; остальные получают устаревшее значение,
+а если его нет — ждут результата. В блокировке лежит случайный
+токен: если пересчёт пережил LOCK_TIMEOUT и блокировку уже взял
+другой, чужая блокировка не снимается.
+
+В режиме stale_while_revalidate устаревшее значение отдаётся сразу,
+а пересчёт уходит в фоновый пул из CACHE_REFRESH_WORKERS потоков.
+В очереди не больше CACHE_REFRESH_QUEUE ключей; лишние обновления
+отбрасываются и будут запрошены следующим обращением.
+"""
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.db import connections
+
+LOCK_KEY = '{}:lock'
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.05
+BETA = 1.0
+
+logger = logging.getLogger(__name__)
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+_stats = dict.fromkeys((
+    'hits', 'stale_hits', 'misses', 'refreshes', 'dropped',
+    'refresh_lag_total', 'refresh_lag_last',
+), 0)
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+
+def stats():
+    """Счётчики этого процесса: доля попаданий и задержка обновления."""
+    with _lock:
+        result = dict(_stats)
+        result['pending'] = len(_pending)
+    served = result['hits'] + result['stale_hits']
+    total = served + result['misses']
+    result['hit_ratio'] = served / total if total else 0.0
+    result['refresh_lag_mean'] = (
+        result['refresh_lag_total'] / result['refreshes']
+        if result['refreshes'] else 0.0
+    )
+    return result
+
+
+def _is_fresh(entry, now, beta):
+    value, delta, expires = entry
+    if expires is None:
+        return True
+    return now - delta * beta * math.log(1.0 - random.random()) < expires
+
+
+def acquire(lock, cache=None, timeout=LOCK_TIMEOUT):
+    """Токен захваченной блокировки или None, если она занята."""
+    cache = cache or default_cache
+    token = uuid.uuid4().hex
+    return token if cache.add(lock, token, timeout) else None
+
+
+def release(lock, token, cache=None):
+    """Снимает блокировку, только если она всё ещё наша."""
+    cache = cache or default_cache
+    if cache.get(lock) == token:
+        cache.delete(lock)
+
+
+@contextmanager
+def locked(lock, wait=WAIT_TIMEOUT, cache=None):
+    """Держит блокировку lock; TimeoutError, если не дождались."""
+    deadline = time.time() + wait
+    token = acquire(lock, cache)
+    while token is None:
+        if time.time() >= deadline:
+            raise TimeoutError(f'Блокировка {lock} занята')
+        time.sleep(POLL_INTERVAL)
+        token = acquire(lock, cache)
+    try:
+        yield
+    finally:
+        release(lock, token, cache)
+
+
+def _compute(key, compute, timeout, cache):
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    if timeout is None:
+        cache.set(key, (value, delta, None), None)
+    else:
+        # Запись живёт вдвое дольше срока, чтобы было что отдать,
+        # пока её пересчитывают.
+        cache.set(key, (value, delta, start + timeout), timeout * 2)
+    return value
+
+
+def _refresh(key, compute, timeout, cache, expires, background=False):
+    lock = LOCK_KEY.format(key)
+    try:
+        token = acquire(lock, cache)
+        if token is not None:
+            try:
+                _compute(key, compute, timeout, cache)
+            except Exception:
+                logger.exception('Не удалось обновить ключ %s', key)
+                return
+            finally:
+                release(lock, token, cache)
+            lag = max(time.time() - expires, 0.0)
+            with _lock:
+                _stats['refreshes'] += 1
+                _stats['refresh_lag_total'] += lag
+                _stats['refresh_lag_last'] = lag
+    finally:
+        with _lock:
+            _pending.discard(key)
+        if background:
+            # Соединения с базой у каждого потока свои.
+            connections.close_all()
+
+
+def _schedule(key, compute, timeout, cache, expires):
+    global _executor
+    workers = getattr(settings, 'CACHE_REFRESH_WORKERS', 4)
+    limit = getattr(settings, 'CACHE_REFRESH_QUEUE', 100)
+    with _lock:
+        if key in _pending:
+            return
+        if len(_pending) >= limit:
+            _stats['dropped'] += 1
+            return
+        _pending.add(key)
+        if workers and _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='cache-refresh')
+    if workers:
+        _executor.submit(
+            _refresh, key, compute, timeout, cache, expires, True)
+    else:
+        _refresh(key, compute, timeout, cache, expires)
+
+
+def prime(keys, compute_many, timeout, cache=None):
+    """Заполняет отсутствующие ключи в формате get_or_set.
+
+    compute_many(missing) возвращает {ключ: значение} для недостающих
+    ключей; всё записывается одним set_many.
+    """
+    cache = cache or default_cache
+    keys = list(keys)
+    if not keys:
+        return
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if not missing:
+        return
+    set_many(compute_many(missing), timeout, cache)
+
+
+def get_many(keys, cache=None, refresh=None, timeout=None):
+    """Значения ключей в формате get_or_set; истёкшие считаются промахом.
+
+    С refresh(key) истёкшее значение отдаётся, а ключ пересчитывается
+    в фоне со сроком timeout, как в stale_while_revalidate.
+    """
+    cache = cache or default_cache
+    keys = list(keys)
+    now = time.time()
+    result = {}
+    for key, (value, _, expires) in cache.get_many(keys).items():
+        if expires is None or expires > now:
+            _count('hits')
+        elif refresh is not None:
+            _count('stale_hits')
+            _schedule(key, partial(refresh, key), timeout, cache, expires)
+        else:
+            continue
+        result[key] = value
+    _count('misses', len(keys) - len(result))
+    return result
+
+
+def set_many(values, timeout, cache=None):
+    """Записывает {ключ: значение} в формате get_or_set."""
+    cache = cache or default_cache
+    now = time.time()
+    cache.set_many({
+        key: (value, 0.0, now + timeout)
+        for key, value in values.items()
+    }, timeout * 2)
+
+
+def get_or_set(key, compute, timeout, beta=BETA, cache=None,
+               stale_while_revalidate=False):
+    """Значение ключа; compute() вызывается одним процессом за раз."""
+    cache = cache or default_cache
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry, time.time(), beta):
+        _count('hits')
+        return entry[0]
+    if entry is not None and stale_while_revalidate:
+        _count('stale_hits')
+        _schedule(key, compute, timeout, cache, entry[2])
+        return entry[0]
+    _count('misses')
+    lock = LOCK_KEY.format(key)
+    token = acquire(lock, cache)
+    if token is not None:
+        try:
+            return _compute(key, compute, timeout, cache)
+        finally:
+            release(lock, token, cache)
+    if entry is not None:
+        return entry[0]
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if cache.get(lock) is None:
+            break
+    return _compute(key, compute, timeout, cache)
@@ -0,0 +1,8 @@
+from core.loader import for_request
+
+
+def loader(request):
+    """Добавляет загрузчик данных запроса (core.loader)."""
+    return {
+        'loader': for_request(request),
+    }
@@ -0,0 +1,118 @@
+"""Счётчики с накоплением приращений в памяти процесса.
+
+UPDATE ... SET count = count + 1 на каждое событие выстраивает всех
+писателей в очередь за блокировкой базы. BufferedCounter складывает
+приращения по ключам в словарь и отдаёт их функции flush одной пачкой.
+Сброс выполняется после отправки ответа (сигнал request_finished),
+если с прошлого сброса прошло interval секунд, и при выходе процесса.
+В простаивающем процессе приращения ждут следующего запроса или выхода.
+
+Память ограничена max_keys ключами. Что делать с новым ключом, когда
+словарь полон, задаёт overflow:
+
+* FLUSH — сбросить всё сразу, в текущем запросе; ничего не теряется,
+  но запрос ждёт записи в базу;
+* DROP — отбросить приращение и увеличить dropped; запрос не ждёт,
+  под перегрузкой счётчик занижается.
+
+Пока приращения не сброшены, они видны только своему процессу
+(pending); при аварийном завершении процесса они теряются. Если
+сброс не удался, приращения возвращаются в словарь до следующей
+попытки. discard_all выбрасывает несброшенные приращения всех
+счётчиков.
+"""
+import atexit
+import logging
+import threading
+import time
+import weakref
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH = 'flush'
+DROP = 'drop'
+
+_instances = weakref.WeakSet()
+
+
+class BufferedCounter:
+    def __init__(self, flush, interval=5, max_keys=10000, overflow=FLUSH):
+        self._flush = flush
+        self.interval = interval
+        self.max_keys = max_keys
+        self.overflow = overflow
+        self.dropped = 0
+        self._deltas = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _instances.add(self)
+
+    def add(self, key, delta=1):
+        """Учитывает приращение; False — отброшено из-за переполнения."""
+        with self._lock:
+            full = (
+                key not in self._deltas
+                and len(self._deltas) >= self.max_keys
+            )
+            if full and self.overflow == DROP:
+                self.dropped += 1
+                return False
+            self._deltas[key] += delta
+        if full:
+            self.flush()
+        return True
+
+    def pending(self):
+        """Ещё не сброшенные приращения этого процесса."""
+        with self._lock:
+            return dict(self._deltas)
+
+    def get(self, key):
+        """Несброшенное приращение одного ключа."""
+        with self._lock:
+            return self._deltas.get(key, 0)
+
+    def due(self):
+        return time.monotonic() - self._last_flush >= self.interval
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+            self._last_flush = time.monotonic()
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        try:
+            self._flush(deltas)
+        except Exception:
+            logger.exception('Не удалось сбросить счётчики')
+            # Вернём приращения, чтобы попробовать при следующем сбросе.
+            with self._lock:
+                self._deltas.update(deltas)
+            return 0
+        return len(deltas)
+
+    def discard(self):
+        """Выбрасывает несброшенные приращения."""
+        with self._lock:
+            self._deltas.clear()
+
+
+def flush_due(**kwargs):
+    """Сбрасывает счётчики, у которых подошёл срок (request_finished)."""
+    for counter in list(_instances):
+        if counter.due():
+            counter.flush()
+
+
+def discard_all():
+    for counter in list(_instances):
+        counter.discard()
+
+
+@atexit.register
+def flush_all():
+    for counter in list(_instances):
+        counter.flush()
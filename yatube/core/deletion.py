@@ -0,0 +1,112 @@
+"""Удаление объектов с большими каскадами по частям в фоне.
+
+Обычный delete() удаляет пользователя со всеми постами, комментариями
+и подписками в одной транзакции и надолго блокирует базу. Здесь
+объект сразу скрывается (функция hide из плана), а зависимые строки
+удаляются или обнуляются пачками по BATCH_SIZE в задачах очереди
+core.jobs. Каждая пачка — отдельная короткая транзакция, в которой
+сохраняется и прогресс в DeletionTask, поэтому после сбоя удаление
+продолжается с того же места (см. resume). Последним удаляется сам
+объект, к этому моменту его каскад уже пуст.
+
+План регистрируется для модели::
+
+    deletion.register(Group, hide=hide_group, steps=[
+        deletion.Step(lambda pk: Post.objects.filter(group_id=pk),
+                      nullify='group'),
+    ])
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue, job
+from .models import DeletionTask
+
+BATCH_SIZE = 200
+
+_plans = {}
+
+
+class Step:
+    """Зависимые строки: queryset(pk корня) и что с ними сделать.
+
+    Если задан nullify, поле с этим именем обнуляется, иначе строки
+    удаляются. Шаг выполняется, пока queryset не опустеет.
+    """
+
+    def __init__(self, queryset, nullify=None):
+        self.queryset = queryset
+        self.nullify = nullify
+
+    def run(self, pk, size):
+        """Обрабатывает одну пачку и возвращает её размер."""
+        queryset = self.queryset(pk)
+        ids = list(queryset.values_list('pk', flat=True)[:size])
+        if ids:
+            batch = queryset.model._base_manager.filter(pk__in=ids)
+            if self.nullify:
+                batch.update(**{self.nullify: None})
+            else:
+                batch.delete()
+        return len(ids)
+
+
+def register(model, hide, steps):
+    _plans[model] = (hide, steps)
+
+
+def _enqueue(task):
+    enqueue(
+        'core.delete',
+        {'task_id': task.pk},
+        dedup_key=f'delete:{task.pk}',
+    )
+
+
+def schedule(obj):
+    """Скрывает obj и ставит удаление его каскада в очередь."""
+    hide, _ = _plans[type(obj)]
+    content_type = ContentType.objects.get_for_model(obj)
+    with transaction.atomic():
+        hide(obj)
+        task, _ = DeletionTask.objects.get_or_create(
+            content_type=content_type,
+            object_id=obj.pk,
+            status=DeletionTask.RUNNING,
+            defaults={'object_repr': str(obj)[:200]},
+        )
+    _enqueue(task)
+    return task
+
+
+def resume():
+    """Заново ставит в очередь незавершённые удаления."""
+    tasks = DeletionTask.objects.filter(status=DeletionTask.RUNNING)
+    for task in tasks:
+        _enqueue(task)
+    return len(tasks)
+
+
+@job('core.delete')
+def run_deletion(payload):
+    task = DeletionTask.objects.filter(
+        pk=payload['task_id'], status=DeletionTask.RUNNING).first()
+    if task is None:
+        return
+    model = task.content_type.model_class()
+    _, steps = _plans[model]
+    with transaction.atomic():
+        if task.step < len(steps):
+            done = steps[task.step].run(task.object_id, BATCH_SIZE)
+            if done:
+                task.processed += done
+            else:
+                task.step += 1
+        else:
+            model._base_manager.filter(pk=task.object_id).delete()
+            task.status = DeletionTask.DONE
+            task.finished = timezone.now()
+        task.save()
+    if task.status == DeletionTask.RUNNING:
+        _enqueue(task)
@@ -0,0 +1,137 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача — строка Job с именем обработчика и JSON-нагрузкой. Обработчики
+регистрируются декоратором job, задачи ставятся вызовом enqueue и
+выполняются командой runjobs. Задача с dedup_key не ставится, если
+такая же ещё ждёт в очереди; захваченная задача ключ освобождает,
+чтобы изменения во время её выполнения не потерялись. Воркер
+захватывает пачку задач на время LEASE; если он упал, задачи снова
+станут доступны. Упавшая задача повторяется с экспоненциальной
+задержкой до MAX_ATTEMPTS раз.
+
+Обработчик с batch=True получает список нагрузок всех задач своего
+имени из пачки, иначе — одну нагрузку.
+"""
+import json
+import traceback
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 50
+LEASE = timedelta(minutes=5)
+RETRY_DELAY = 10
+
+_registry = {}
+
+
+def job(name, batch=False):
+    """Регистрирует обработчик задач с именем name."""
+    def decorator(func):
+        _registry[name] = (func, batch)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, dedup_key=None, delay=0):
+    """Ставит задачу в очередь; при JOBS_EAGER выполняет сразу."""
+    if name not in _registry:
+        raise KeyError(f'Неизвестная задача {name}')
+    if getattr(settings, 'JOBS_EAGER', False):
+        func, batch = _registry[name]
+        func([payload] if batch else payload)
+        return None
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                payload=json.dumps(payload),
+                dedup_key=dedup_key,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        # Такая задача уже ждёт в очереди.
+        return None
+
+
+def claim(size=BATCH_SIZE, worker=None):
+    """Захватывает до size готовых задач и возвращает их."""
+    worker = worker or uuid.uuid4().hex
+    now = timezone.now()
+    ready = (
+        Q(status=Job.PENDING, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+    ids = list(Job.objects.filter(ready).values_list('id', flat=True)[:size])
+    if not ids:
+        return []
+    # Условие повторяется в UPDATE: задачу, которую успел захватить
+    # другой воркер, мы не получим.
+    Job.objects.filter(ready, id__in=ids).update(
+        status=Job.RUNNING,
+        dedup_key=None,
+        locked_by=worker,
+        locked_until=now + LEASE,
+    )
+    return list(Job.objects.filter(locked_by=worker))
+
+
+def _succeeded(jobs):
+    Job.objects.filter(id__in=[item.id for item in jobs]).delete()
+
+
+def _failed(jobs, error):
+    for item in jobs:
+        item.attempts += 1
+        item.last_error = error
+        item.locked_by = None
+        item.locked_until = None
+        if item.attempts >= MAX_ATTEMPTS:
+            item.status = Job.FAILED
+        else:
+            item.status = Job.PENDING
+            item.run_after = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** item.attempts)
+        item.save()
+
+
+def run(jobs):
+    """Выполняет захваченные задачи, группируя их по имени."""
+    jobs = sorted(jobs, key=lambda item: (item.name, item.id))
+    for name, group in groupby(jobs, key=lambda item: item.name):
+        group = list(group)
+        if name not in _registry:
+            _failed(group, f'Неизвестная задача {name}')
+            continue
+        func, batch = _registry[name]
+        if batch:
+            chunks = [group]
+        else:
+            chunks = [[item] for item in group]
+        for chunk in chunks:
+            payloads = [json.loads(item.payload) for item in chunk]
+            try:
+                func(payloads if batch else payloads[0])
+            except Exception:
+                _failed(chunk, traceback.format_exc())
+            else:
+                _succeeded(chunk)
+    return len(jobs)
+
+
+def run_pending(size=BATCH_SIZE):
+    """Выполняет все готовые задачи; возвращает их число."""
+    done = 0
+    while True:
+        jobs = claim(size)
+        if not jobs:
+            return done
+        done += run(jobs)
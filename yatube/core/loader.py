@@ -0,0 +1,61 @@
+"""Пакетная загрузка данных для шаблонов в пределах одного запроса.
+
+Источник данных регистрируется вызовом register(kind, batch), где
+batch(loader, keys) возвращает {ключ: значение} для набора ключей.
+load_many загружает все ещё не загруженные ключи вида одним вызовом
+batch — одним запросом к базе или одним get_many к кэшу. Результаты
+запоминаются до конца запроса; ключ, которого нет в ответе,
+запоминается как None.
+
+Загрузчик создаётся LoaderMiddleware и доступен как request.loader,
+а в шаблонах — как переменная loader (фильтр with_cards).
+"""
+from collections import defaultdict
+
+_sources = {}
+
+
+def register(kind, batch):
+    _sources[kind] = batch
+
+
+class Loader:
+    def __init__(self, request=None):
+        self.request = request
+        self._loaded = defaultdict(dict)
+
+    @property
+    def user(self):
+        return getattr(self.request, 'user', None)
+
+    def load_many(self, kind, keys):
+        if kind not in _sources:
+            raise KeyError(f'Нет источника данных {kind!r}')
+        keys = list(keys)
+        loaded = self._loaded[kind]
+        missing = {key for key in keys if key not in loaded}
+        if missing:
+            found = _sources[kind](self, list(missing))
+            for key in missing:
+                loaded[key] = found.get(key)
+        return {key: loaded[key] for key in keys}
+
+    def load(self, kind, key):
+        return self.load_many(kind, [key])[key]
+
+
+def for_request(request):
+    """Загрузчик запроса; без LoaderMiddleware создаётся при обращении."""
+    loader = getattr(request, 'loader', None)
+    if loader is None:
+        loader = request.loader = Loader(request)
+    return loader
+
+
+class LoaderMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.loader = Loader(request)
+        return self.get_response(request)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import deletion
+
+
+class Command(BaseCommand):
+    help = 'Заново ставит в очередь незавершённые фоновые удаления.'
+
+    def handle(self, *args, **options):
+        count = deletion.resume()
+        self.stdout.write(f'Возобновлено удалений: {count}')
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Число потоков-воркеров.',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=jobs.BATCH_SIZE,
+            help='Сколько задач захватывает воркер за раз.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            done = jobs.run_pending(options['batch'])
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=self.work,
+                args=(stop, options['batch'], options['interval']),
+                daemon=True,
+            )
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def work(self, stop, batch, interval):
+        try:
+            while not stop.is_set():
+                claimed = jobs.claim(batch)
+                if claimed:
+                    jobs.run(claimed)
+                else:
+                    stop.wait(interval)
+        finally:
+            connections.close_all()
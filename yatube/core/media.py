@@ -0,0 +1,121 @@
+"""Отдача загруженных файлов из MEDIA_ROOT.
+
+Условные запросы (If-None-Match, If-Modified-Since) решаются по
+метаданным файла, сам файл при этом не открывается. Если задан
+MEDIA_ACCEL_REDIRECT, тело отдаёт фронтенд-сервер по заголовку
+X-Accel-Redirect, иначе FileResponse передаёт файл через
+wsgi.file_wrapper (sendfile там, где сервер его поддерживает).
+Поддерживается один диапазон байтов (Range); запрос нескольких
+диапазонов получает файл целиком, как разрешает RFC 7233.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+MEDIA_MAX_AGE = 60 * 60 * 24
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag(stat_result):
+    return '"%x-%x"' % (int(stat_result.st_mtime), stat_result.st_size)
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')]
+    since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(mtime) <= since
+
+
+def _byte_range(request, size, etag):
+    """(start, end) включительно, None — весь файл, False — 416."""
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Файл не найден')
+    etag = _etag(stat_result)
+    size = stat_result.st_size
+    content_type = mimetypes.guess_type(full_path)[0]
+    content_type = content_type or 'application/octet-stream'
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        byte_range = _byte_range(request, size, etag)
+        accel = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif accel:
+            # Диапазоны и сжатие обработает фронтенд-сервер.
+            response = HttpResponse(content_type=content_type)
+            # Заголовок — latin-1, поэтому имя файла кодируется в URL.
+            response['X-Accel-Redirect'] = accel + quote(path)
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(
+                open(full_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat_result.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}'
+    return response
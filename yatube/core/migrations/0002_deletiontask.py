@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('object_repr', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('done', 'Завершено')], default='running', max_length=10)),
+                ('step', models.PositiveSmallIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+    ]
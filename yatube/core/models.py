@@ -0,0 +1,67 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    dedup_key = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(db_index=True)
+    locked_by = models.CharField(max_length=64, blank=True, null=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        ordering = ('run_after', )
+
+
+class DeletionTask(models.Model):
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+    )
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    object_repr = models.CharField(max_length=200)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=RUNNING
+    )
+    step = models.PositiveSmallIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.content_type.model} {self.object_repr}'
+
+    class Meta:
+        ordering = ('-created', )
@@ -0,0 +1,255 @@
+"""Кэш в файле SQLite, общий для всех процессов на машине.
+
+LocMemCache живёт внутри процесса: каждый воркер рисует фрагменты
+заново, а сброс ключа в одном воркере не виден остальным. Этот бэкенд
+хранит записи в одной таблице SQLite в режиме WAL, так что читатели
+не блокируют писателя.
+
+Вытеснение — по давности обращения (LRU): время обращения
+обновляется не чаще раза в ACCESS_RESOLUTION секунд, чтобы чтение
+почти никогда не превращалось в запись. Когда записей больше
+MAX_ENTRIES, удаляются просроченные и 1/CULL_FREQUENCY самых старых.
+incr/decr выполняются в транзакции BEGIN IMMEDIATE и атомарны между
+процессами.
+
+Настройка::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+ACCESS_RESOLUTION = 60
+CULL_CHECK_EVERY = 100
+BUSY_TIMEOUT = 30
+# Ограничение SQLite на число параметров в запросе.
+MAX_PARAMS = 900
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+
+def _chunks(items, size=MAX_PARAMS):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    @property
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _write(self):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _fetch(self, keys):
+        """Живые записи по ключам; заодно отмечает обращение к ним."""
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in _chunks(keys):
+            rows = self._connection.execute(
+                'SELECT key, value, accessed FROM cache '
+                'WHERE key IN (%s) AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)),
+                chunk + [now],
+            )
+            for key, value, accessed in rows:
+                found[key] = pickle.loads(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append(key)
+        if stale:
+            with self._write() as connection:
+                for chunk in _chunks(stale):
+                    connection.execute(
+                        'UPDATE cache SET accessed = ? WHERE key IN (%s)'
+                        % ', '.join('?' * len(chunk)),
+                        [now] + chunk,
+                    )
+        return found
+
+    def _store(self, connection, items, timeout, mode='REPLACE'):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        cursor = connection.executemany(
+            f'INSERT OR {mode} INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            [(key, self._dumps(value), expires, now)
+             for key, value in items],
+        )
+        self._sets += len(items)
+        if self._sets >= CULL_CHECK_EVERY:
+            self._sets = 0
+            self._cull(connection, now)
+        return cursor.rowcount
+
+    def _cull(self, connection, now):
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            [now],
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            if self._cull_frequency == 0:
+                connection.execute('DELETE FROM cache')
+                return
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                [count // self._cull_frequency],
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        mapping = {self._key(key, version): key for key in keys}
+        if not mapping:
+            return {}
+        found = self._fetch(list(mapping))
+        return {mapping[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            self._store(connection, [(key, value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [(self._key(key, version), value)
+                 for key, value in data.items()]
+        if items:
+            with self._write() as connection:
+                self._store(connection, items, timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                [key, time.time()],
+            )
+            return self._store(
+                connection, [(key, value)], timeout, mode='IGNORE') == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [self.get_backend_timeout(timeout), key, time.time()],
+            )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [key, time.time()],
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                [self._dumps(value), key],
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return bool(self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [key, time.time()],
+        ).fetchone())
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._write() as connection:
+            for chunk in _chunks(keys):
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN (%s)'
+                    % ', '.join('?' * len(chunk)),
+                    chunk,
+                )
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами потока.
+        pass
@@ -0,0 +1,185 @@
+"""Статика с хешами в именах, предварительным сжатием и долгим кэшем.
+
+collectstatic с CompressedManifestStaticFilesStorage копирует файлы
+в STATIC_ROOT под именами с хешем содержимого, пишет манифест
+staticfiles.json и кладёт рядом сжатые копии .gz и .br. Тег static
+берёт хешированное имя из манифеста, загруженного один раз, без
+обращений к диску.
+
+PrecompressedStaticMiddleware отдаёт файлы из STATIC_ROOT: при старте
+один раз обходит каталог, а на запрос выбирает сжатую копию по
+Accept-Encoding. Хешированные файлы отдаются как immutable на год.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json',
+    'image/svg+xml', 'application/xml',
+)
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+DEFAULT_MAX_AGE = 60
+# Порядок предпочтения сжатых копий.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _compressible(name):
+    content_type = mimetypes.guess_type(name)[0] or ''
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # Без collectstatic (разработка, тесты) манифеста нет:
+        # отдаём имя как есть.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if _compressible(name):
+                self._compress(name)
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        variants = (
+            ('.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+            ('.br', brotli.compress(content)),
+        )
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as target:
+                    target.write(compressed)
+
+
+class StaticFile:
+    __slots__ = ('path', 'content_type', 'etag', 'last_modified',
+                 'immutable', 'variants')
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = (
+            mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        self.etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+        self.last_modified = http_date(stat.st_mtime)
+        self.immutable = immutable
+        self.variants = [
+            (encoding, path + suffix)
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        ]
+
+
+def scan(root, hashed_names):
+    """Индекс {относительный путь: StaticFile} по каталогу root."""
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files[relative] = StaticFile(path, relative in hashed_names)
+    return files
+
+
+def accepted_encodings(header):
+    """{кодировка: q} из Accept-Encoding; q=0 значит «нельзя»."""
+    result = {}
+    for item in header.split(','):
+        token, *params = [part.strip() for part in item.split(';')]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[token.lower()] = q
+    return result
+
+
+def is_accepted(encoding, accepted):
+    if encoding in accepted:
+        return accepted[encoding] > 0
+    return accepted.get('*', 0) > 0
+
+
+class PrecompressedStaticMiddleware:
+    """Отдаёт STATIC_ROOT со сжатыми копиями и заголовками кэширования."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = None
+
+    def load(self):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            return {}
+        storage = CompressedManifestStaticFilesStorage()
+        return scan(root, set(storage.hashed_files.values()))
+
+    def __call__(self, request):
+        if not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        if self.files is None:
+            self.files = self.load()
+        name = posixpath.normpath(request.path[len(self.prefix):])
+        static_file = self.files.get(name)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        path, encoding = static_file.path, None
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for candidate, variant in static_file.variants:
+            if is_accepted(candidate, accepted):
+                path, encoding = variant, candidate
+                break
+        etag = static_file.etag
+        if encoding:
+            etag = f'{etag[:-1]}-{encoding}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(
+                open(path, 'rb'), content_type=static_file.content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = static_file.last_modified
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            response['Cache-Control'] = (
+                f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+        else:
+            response['Cache-Control'] = f'public, max-age={DEFAULT_MAX_AGE}'
+        return response
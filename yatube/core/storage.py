@@ -0,0 +1,57 @@
+"""Хранилище, раскладывающее загрузки по вложенным каталогам.
+
+Вместо posts/name.jpg файл сохраняется как posts/ab/cd/name.jpg, где
+ab и cd — первые байты md5 от имени с солью. Два уровня по 256
+каталогов держат каждый каталог небольшим при миллионах файлов.
+Для новых загрузок соль случайная; команда shard_media переносит
+старые файлы без соли, чтобы повторный запуск вычислял тот же путь.
+
+walk_sorted обходит каталог хранилища и выдаёт имена файлов в порядке
+сравнения строк, не собирая их в память; по нему команда gc_media
+сливает список файлов с отсортированным списком имён из базы.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+SHARDED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+
+
+def shard_name(name, salt=''):
+    directory, base = os.path.split(name)
+    digest = hashlib.md5((salt + base).encode()).hexdigest()
+    return os.path.join(directory, digest[:2], digest[2:4], base)
+
+
+def is_sharded(name):
+    return bool(SHARDED_NAME_RE.search(name))
+
+
+def walk_sorted(root, prefix=''):
+    """Имена файлов (через /) под root в лексикографическом порядке."""
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    # Каталог сравнивается как «имя/»: так все его файлы встают
+    # на свои места среди соседних имён.
+    keyed = sorted((
+        (entry.name + '/' if entry.is_dir() else entry.name, entry)
+        for entry in entries
+    ), key=lambda pair: pair[0])
+    for key, entry in keyed:
+        if key.endswith('/'):
+            yield from walk_sorted(entry.path, prefix + key)
+        else:
+            yield prefix + key
+
+
+@deconstructible
+class ShardedFileSystemStorage(FileSystemStorage):
+    def generate_filename(self, filename):
+        return shard_name(
+            super().generate_filename(filename), uuid.uuid4().hex)
@@ -0,0 +1,47 @@
+from django import template
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags import cache as cache_tags
+
+from core.cache import get_or_set
+
+register = template.Library()
+
+
+class CoalescedCacheNode(cache_tags.CacheNode):
+    """Тег cache с единственным пересчётом и фоновым обновлением.
+
+    Устаревший фрагмент отдаётся сразу, а перерисовывается в фоне
+    на копии контекста: исходный контекст к тому времени уже занят
+    дальнейшей отрисовкой страницы.
+    """
+
+    def render(self, context):
+        expire_time = self.expire_time_var.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        cache_name = 'default'
+        if self.cache_name:
+            cache_name = self.cache_name.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        fragment_context = context.new(context.flatten())
+        return get_or_set(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(fragment_context),
+            expire_time,
+            cache=caches[cache_name],
+            stale_while_revalidate=True,
+        )
+
+
+@register.tag('cache')
+def do_cache(parser, token):
+    """Тот же синтаксис, что у {% cache %} из django.templatetags."""
+    node = cache_tags.do_cache(parser, token)
+    return CoalescedCacheNode(
+        node.nodelist,
+        node.expire_time_var,
+        node.fragment_name,
+        node.vary_on,
+        node.cache_name,
+    )
@@ -0,0 +1,53 @@
+import copy
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core import counters
+
+SQLITE_CACHE = 'core.sqlite_cache.SQLiteCache'
+
+
+@contextmanager
+def temporary_caches():
+    """Файловые кэши во временном каталоге на время тестов.
+
+    Тесты очищают кэш и кладут в него ключи тестовой базы; общий
+    файл кэша рабочих процессов они трогать не должны.
+    """
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = copy.deepcopy(settings.CACHES)
+    for alias, config in caches.items():
+        if config.get('BACKEND') == SQLITE_CACHE:
+            config['LOCATION'] = os.path.join(directory, f'{alias}.sqlite3')
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты со своим кэшем и без сброса счётчиков в рабочую базу.
+
+    Приращения, оставшиеся после тестов, сбросились бы при выходе
+    процесса, когда тестовая база уже удалена.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._stack = ExitStack()
+        self._stack.enter_context(temporary_caches())
+
+    def teardown_test_environment(self, **kwargs):
+        self._stack.close()
+        super().teardown_test_environment(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        counters.discard_all()
+        super().teardown_databases(old_config, **kwargs)
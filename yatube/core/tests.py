@@ -0,0 +1,348 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from core import jobs, loader, sqlite_cache
+from core.counters import DROP, BufferedCounter
+from core.models import Job
+from core.sqlite_cache import SQLiteCache
+
+calls = []
+
+
+@jobs.job('test.record')
+def record(payload):
+    calls.append(payload)
+
+
+@jobs.job('test.record_batch', batch=True)
+def record_batch(payloads):
+    calls.append(payloads)
+
+
+@jobs.job('test.fail')
+def fail(payload):
+    raise ValueError('ошибка')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Задача ставится в очередь и удаляется после выполнения."""
+        jobs.enqueue('test.record', {'n': 1})
+        self.assertEqual(calls, [])
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(calls, [{'n': 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_dedup_while_pending(self):
+        """Одинаковые задачи в очереди не дублируются."""
+        jobs.enqueue('test.record', {'n': 1}, dedup_key='same')
+        jobs.enqueue('test.record', {'n': 2}, dedup_key='same')
+        self.assertEqual(Job.objects.count(), 1)
+        claimed = jobs.claim()
+        jobs.enqueue('test.record', {'n': 3}, dedup_key='same')
+        jobs.run(claimed)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_batch_handler(self):
+        """Пакетный обработчик получает все нагрузки одним вызовом."""
+        for n in range(3):
+            jobs.enqueue('test.record_batch', {'n': n})
+        jobs.run_pending()
+        self.assertEqual(calls, [[{'n': 0}, {'n': 1}, {'n': 2}]])
+
+    def test_retry_then_fail(self):
+        """Упавшая задача откладывается, а после MAX_ATTEMPTS — помечается."""
+        jobs.enqueue('test.fail', {})
+        jobs.run_pending()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('ValueError', job.last_error)
+        for _ in range(jobs.MAX_ATTEMPTS - 1):
+            Job.objects.update(run_after=job.created)
+            jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_mode(self):
+        """В режиме JOBS_EAGER задача выполняется сразу."""
+        jobs.enqueue('test.record', {'n': 1})
+        self.assertEqual(calls, [{'n': 1}])
+        self.assertFalse(Job.objects.exists())
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_tests_use_temporary_cache(self):
+        """Тесты не пишут в общий файл кэша проекта."""
+        location = settings.CACHES['default']['LOCATION']
+        self.assertNotEqual(
+            location, os.path.join(settings.BASE_DIR, 'cache.sqlite3'))
+        cache.set('probe', 1)
+        self.assertTrue(os.path.exists(location))
+
+    def test_basic_operations(self):
+        """Основные операции бэкенда кэша."""
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('b', 2))
+        self.cache.set_many({'c': 3, 'd': 4})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c', 'missing']),
+            {'a': {'x': 1}, 'b': 2, 'c': 3},
+        )
+        self.cache.delete_many(['c', 'd'])
+        self.assertFalse(self.cache.has_key('c'))
+        self.assertEqual(self.cache.incr('b', 5), 7)
+        self.assertEqual(self.cache.decr('b'), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry(self):
+        """Просроченная запись не читается и может быть добавлена заново."""
+        self.cache.set('a', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому на том же файле."""
+        other = SQLiteCache(self.location, {})
+        self.cache.set('shared', 'значение')
+        self.assertEqual(other.get('shared'), 'значение')
+        other.delete('shared')
+        self.assertIsNone(self.cache.get('shared'))
+
+    def test_cull_least_recently_used(self):
+        """При переполнении вытесняются давно не читанные записи."""
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+        cache.set_many({f'key{n}': n for n in range(10)})
+        connection = cache._connection
+        connection.execute('UPDATE cache SET accessed = 0')
+        cache.get_many([f'key{n}' for n in range(5, 10)])
+        cache._sets = sqlite_cache.CULL_CHECK_EVERY
+        cache.set('new', 1)
+        self.assertEqual(cache.get_many([f'key{n}' for n in range(5)]), {})
+        self.assertEqual(len(cache.get_many(
+            [f'key{n}' for n in range(5, 10)] + ['new'])), 6)
+
+
+class StaticPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.source = os.path.join(cls.directory, 'source')
+        cls.root = os.path.join(cls.directory, 'root')
+        os.makedirs(os.path.join(cls.source, 'css'))
+        with open(os.path.join(cls.source, 'css', 'site.css'), 'w') as f:
+            f.write('body { color: black; }\n' * 100)
+        cls.static_settings = override_settings(
+            STATICFILES_DIRS=[cls.source], STATIC_ROOT=cls.root)
+        cls.static_settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_settings.disable()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_hashed_and_compressed(self):
+        """collectstatic пишет хешированные имена и сжатые копии."""
+        name = staticfiles_storage.stored_name('css/site.css')
+        self.assertNotEqual(name, 'css/site.css')
+        path = os.path.join(self.root, name)
+        self.assertTrue(os.path.exists(path + '.gz'))
+        self.assertTrue(os.path.exists(path + '.br'))
+
+    def test_serves_precompressed_immutable(self):
+        """Сжатая копия отдаётся с долгим кэшем и ETag."""
+        url = staticfiles_storage.url('css/site.css')
+        client = Client()
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        response = client.get(
+            url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        response = client.get(
+            url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_accept_encoding_q_values(self):
+        """Кодировка с q=0 и похожие имена не выбираются."""
+        url = staticfiles_storage.url('css/site.css')
+        client = Client()
+        response = client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = client.get(url, HTTP_ACCEPT_ENCODING='x-gzip, brotli')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = client.get(url, HTTP_ACCEPT_ENCODING='*;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = client.get(url, HTTP_ACCEPT_ENCODING='*, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.media_root, 'posts'))
+        with open(os.path.join(cls.media_root, 'posts', 'a.gif'), 'wb') as f:
+            f.write(bytes(range(100)))
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.url = '/media/posts/a.gif'
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(
+            range(100)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+
+    def test_range(self):
+        """Запрос диапазона отдаёт только нужные байты."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(10, 20)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(95, 100)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional(self):
+        """Повторный запрос с ETag получает 304."""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected/posts/a.gif')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_accel_redirect_quotes_name(self):
+        """Кириллица в имени файла не ломает заголовок."""
+        path = os.path.join(self.media_root, 'posts', 'фото.gif')
+        with open(path, 'wb') as f:
+            f.write(b'GIF')
+        response = self.client.get('/media/posts/фото.gif')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected/posts/%D1%84%D0%BE%D1%82%D0%BE.gif')
+
+    def test_outside_media_root(self):
+        response = self.client.get('/media/../settings.py')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/media/posts/')
+        self.assertEqual(response.status_code, 404)
+
+
+class BufferedCounterTests(SimpleTestCase):
+    def setUp(self):
+        self.flushed = []
+        self.counter = BufferedCounter(
+            self.flushed.append, interval=60, max_keys=3)
+
+    def test_accumulates_until_full(self):
+        self.counter.add('a')
+        self.counter.add('a')
+        self.counter.add('b', -1)
+        self.counter.add('c')
+        self.assertEqual(self.flushed, [])
+        self.assertEqual(self.counter.pending(), {'a': 2, 'b': -1, 'c': 1})
+        self.counter.add('d')
+        self.assertEqual(self.flushed, [{'a': 2, 'b': -1, 'c': 1, 'd': 1}])
+        self.assertEqual(self.counter.pending(), {})
+
+    def test_drop_on_overflow(self):
+        counter = BufferedCounter(
+            self.flushed.append, interval=60, max_keys=1, overflow=DROP)
+        self.assertTrue(counter.add('a'))
+        self.assertTrue(counter.add('a'))
+        self.assertFalse(counter.add('b'))
+        self.assertEqual((counter.pending(), counter.dropped), ({'a': 2}, 1))
+        self.assertEqual(self.flushed, [])
+
+    def test_discard(self):
+        self.counter.add('a')
+        self.counter.discard()
+        self.counter.flush()
+        self.assertEqual(self.flushed, [])
+
+    def test_failed_flush_keeps_deltas(self):
+        def broken(deltas):
+            raise RuntimeError('база недоступна')
+
+        counter = BufferedCounter(broken, interval=60)
+        counter.add('a', 2)
+        with self.assertLogs('core.counters', 'ERROR'):
+            self.assertEqual(counter.flush(), 0)
+        counter.add('a')
+        self.assertEqual(counter.pending(), {'a': 3})
+
+
+class LoaderTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+        def squares(request_loader, keys):
+            self.batches.append(sorted(keys))
+            return {key: key * key for key in keys if key > 0}
+
+        loader.register('test.square', squares)
+
+    def test_missing_keys_loaded_in_one_batch(self):
+        """Незагруженные ключи загружаются одним вызовом источника."""
+        data = loader.Loader()
+        self.assertEqual(
+            data.load_many('test.square', [1, 2, 3]), {1: 1, 2: 4, 3: 9})
+        self.assertEqual(data.load('test.square', 2), 4)
+        self.assertIsNone(data.load('test.square', 0))
+        self.assertIsNone(data.load('test.square', 0))
+        self.assertEqual(self.batches, [[1, 2, 3], [0]])
+
+    def test_unknown_kind(self):
+        with self.assertRaises(KeyError):
+            loader.Loader().load('test.missing', 1)
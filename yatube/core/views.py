@@ -1,6 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 from http import HTTPStatus
 
+from . import cache
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию,
@@ -20,3 +24,9 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def cache_stats(request):
+    """Статистика кэша текущего процесса."""
+    return JsonResponse(cache.stats())
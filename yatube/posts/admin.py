@@ -1,9 +1,13 @@
 from django.contrib import admin
+from django.utils.html import format_html_join
 
+from core.admin import BackgroundDeleteMixin
+
+from . import revisions
 from .models import Group, Post
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -15,7 +19,22 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    readonly_fields = ('edit_history',)
+
+    def edit_history(self, post):
+        return format_html_join(
+            '', '<p><b>#{} {:%d.%m.%Y %H:%M}</b><br>{}</p>',
+            (
+                (revision.number, revision.created, text)
+                for revision, text in reversed(revisions.history(post))
+            ),
+        ) or self.empty_value_display
+    edit_history.short_description = 'История правок'
+
+
+class GroupAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
+    pass
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
@@ -0,0 +1,111 @@
+"""Счётчики, группы и авторы с фоновым обновлением в кэше.
+
+Истёкшее значение отдаётся сразу и обновляется в фоне
+(см. core.cache), а сигналы сбрасывают ключи при изменениях,
+в том числе по старому slug или username после переименования.
+Отсутствие объекта тоже кэшируется: повторные запросы
+несуществующей страницы не доходят до базы. Пользователи хранятся
+только полями users.auth_cache.CACHED_FIELDS, без хеша пароля.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.http import Http404
+
+from core.cache import get_many, get_or_set, prime, set_many
+from users.auth_cache import from_cache, to_cache
+
+from .models import Group, Post
+
+User = get_user_model()
+
+POSTS_COUNT_KEY = 'posts_count:{}'
+POSTS_COUNT_TIMEOUT = 60
+GROUP_KEY = 'group:{}'
+GROUP_TIMEOUT = 60 * 5
+USER_KEY = 'user:v2:{}'
+USER_TIMEOUT = 60 * 5
+
+
+def posts_count(author_id):
+    return Post.visible.filter(author_id=author_id).count()
+
+
+def posts_counts(author_ids):
+    """{id автора: число постов}: один get_many и один запрос на промахи.
+
+    Истёкшие счётчики отдаются сразу и пересчитываются в фоне.
+    """
+    keys = {POSTS_COUNT_KEY.format(pk): pk for pk in author_ids}
+    counts = {
+        keys[key]: value
+        for key, value in get_many(
+            keys,
+            refresh=lambda key: posts_count(keys[key]),
+            timeout=POSTS_COUNT_TIMEOUT,
+        ).items()
+    }
+    missing = [pk for pk in keys.values() if pk not in counts]
+    if missing:
+        counted = dict(
+            Post.visible.filter(author_id__in=missing).order_by()
+            .values('author_id').annotate(total=Count('pk'))
+            .values_list('author_id', 'total')
+        )
+        counts.update((pk, counted.get(pk, 0)) for pk in missing)
+        set_many({
+            POSTS_COUNT_KEY.format(pk): counts[pk] for pk in missing
+        }, POSTS_COUNT_TIMEOUT)
+    return counts
+
+
+def group_or_404(slug):
+    group = get_or_set(
+        GROUP_KEY.format(slug),
+        lambda: Group.objects.filter(
+            slug=slug, hidden=False).first(),
+        GROUP_TIMEOUT,
+        stale_while_revalidate=True,
+    )
+    if group is None:
+        raise Http404('Группа не найдена')
+    return group
+
+
+def user_or_404(username):
+    """Активный пользователь по username."""
+    def compute():
+        user = User.objects.filter(username=username, is_active=True).first()
+        return None if user is None else to_cache(user)
+
+    data = get_or_set(
+        USER_KEY.format(username), compute, USER_TIMEOUT,
+        stale_while_revalidate=True,
+    )
+    if data is None:
+        raise Http404('Пользователь не найден')
+    return from_cache(data)
+
+
+def prime_posts(posts):
+    """Кладёт в кэш группы и авторов постов страницы, если их там нет.
+
+    Посты из буфера главной (from_buffer) пропускаются: их авторы
+    и группы загружены не полностью.
+    """
+    posts = [
+        post for post in posts if not getattr(post, 'from_buffer', False)]
+    objects = {
+        USER_KEY.format(post.author.username): to_cache(post.author)
+        for post in posts
+        if post.author.is_active
+    }
+    objects.update(
+        (GROUP_KEY.format(post.group.slug), post.group)
+        for post in posts
+        if post.group_id is not None and not post.group.hidden
+    )
+    prime(
+        objects,
+        lambda missing: {key: objects[key] for key in missing},
+        min(GROUP_TIMEOUT, USER_TIMEOUT),
+    )
@@ -0,0 +1,45 @@
+"""Кэш отрисованных карточек постов.
+
+Ключ карточки включает id поста, время его изменения и группу.
+Post.updated меняется при редактировании поста, а сигналы
+обновляют его у всех постов автора при смене имени и у всех
+постов группы при её изменении. Поэтому старые карточки просто
+перестают запрашиваться, а лента собирается одним get_many.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_KEY = 'post_card:{}:{}:{}'
+CARD_TIMEOUT = 60 * 60 * 24
+CARD_TEMPLATE = 'includes/post_card.html'
+
+
+def card_key(post):
+    version = int(post.updated.timestamp() * 1000000)
+    return CARD_KEY.format(post.pk, version, post.group_id)
+
+
+def render_card(post):
+    # Оба движка дают одинаковый HTML, так что кэш карточек общий.
+    return render_to_string(
+        CARD_TEMPLATE, {'post': post},
+        using=getattr(settings, 'FEED_TEMPLATE_ENGINE', 'django'))
+
+
+def render_cards(posts):
+    """Возвращает пары (пост, html карточки) для списка постов."""
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    cached = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_card(post)
+        cards.append((post, mark_safe(html)))
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return cards
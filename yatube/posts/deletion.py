@@ -0,0 +1,63 @@
+"""Планы фонового удаления пользователей, групп и постов.
+
+Комментарии к постам удаляются до самих постов, чтобы удаление
+пачки постов не тянуло за собой неограниченный каскад.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from core import deletion
+
+from . import cached, follow_feed, front_page
+from .models import (Comment, Follow, Group, Post, PostRevision, Reaction,
+                     ReactionCounter, Recommendation)
+
+User = get_user_model()
+
+
+def hide_user(user):
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    cache.delete(cached.POSTS_COUNT_KEY.format(user.pk))
+
+
+def hide_group(group):
+    Group.objects.filter(pk=group.pk).update(hidden=True)
+    cache.delete(cached.GROUP_KEY.format(group.slug))
+    front_page.buffer.invalidate()
+
+
+def hide_post(post):
+    Post.objects.filter(pk=post.pk).update(hidden=True)
+    cache.delete(cached.POSTS_COUNT_KEY.format(post.author_id))
+    follow_feed.invalidate(post.author_id)
+    front_page.buffer.invalidate()
+
+
+deletion.register(User, hide=hide_user, steps=[
+    deletion.Step(lambda pk: Comment.objects.filter(author_id=pk)),
+    deletion.Step(lambda pk: Comment.objects.filter(post__author_id=pk)),
+    deletion.Step(lambda pk: Follow.objects.filter(user_id=pk)),
+    deletion.Step(lambda pk: Follow.objects.filter(author_id=pk)),
+    deletion.Step(lambda pk: Recommendation.objects.filter(user_id=pk)),
+    deletion.Step(lambda pk: Recommendation.objects.filter(author_id=pk)),
+    deletion.Step(lambda pk: Reaction.objects.filter(user_id=pk)),
+    deletion.Step(lambda pk: Reaction.objects.filter(post__author_id=pk)),
+    deletion.Step(
+        lambda pk: ReactionCounter.objects.filter(post__author_id=pk)),
+    deletion.Step(
+        lambda pk: PostRevision.objects.filter(post__author_id=pk)),
+    deletion.Step(lambda pk: Post.objects.filter(author_id=pk)),
+])
+
+deletion.register(Group, hide=hide_group, steps=[
+    deletion.Step(
+        lambda pk: Post.objects.filter(group_id=pk), nullify='group'),
+])
+
+deletion.register(Post, hide=hide_post, steps=[
+    deletion.Step(lambda pk: Comment.objects.filter(post_id=pk)),
+    deletion.Step(lambda pk: Reaction.objects.filter(post_id=pk)),
+    deletion.Step(lambda pk: ReactionCounter.objects.filter(post_id=pk)),
+    deletion.Step(lambda pk: PostRevision.objects.filter(post_id=pk)),
+])
@@ -0,0 +1,181 @@
+"""Лента подписок слиянием кэшированных потоков авторов.
+
+Для каждого автора в кэше лежит поток — до STREAM_LENGTH последних
+видимых постов в виде пар (время публикации, id) по убыванию. Поток
+сбрасывается сигналами при сохранении и удалении поста автора.
+Страница ленты получается k-путевым слиянием потоков всех авторов,
+на которых подписан пользователь (heapq.merge), и одним запросом за
+самими постами. Потоки читаются одним get_many; промахи всех
+авторов загружаются одним запросом, который ограничивает поток
+каждого автора в базе. Поток сбрасывается и при
+блокировке или разблокировке автора.
+
+Листание идёт курсором — парой (время, id) последнего поста
+страницы, поэтому новые посты не сдвигают следующие страницы.
+Если страница уходит глубже, чем хранит обрезанный поток какого-то
+автора, она собирается обычным запросом к базе от того же курсора.
+Пост, скрытый без сохранения модели (фоновое удаление, блокировка
+автора), остаётся в потоке, но отсеивается при выборке постов, и
+страница выходит на него короче.
+
+Движок выбирается настройкой FOLLOW_FEED_ENGINE: 'sql' (по
+умолчанию, JOIN с нумерацией страниц) или 'merge'.
+"""
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from core.cache import get_many, set_many
+
+from .models import Post
+
+STREAM_KEY = 'author_stream:{}'
+STREAM_LENGTH = 100
+STREAM_TIMEOUT = 60 * 60 * 24
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+RANK_SQL = (
+    'ROW_NUMBER() OVER (PARTITION BY {table}."author_id" '
+    'ORDER BY {table}."pub_date" DESC, {table}."id" DESC)'
+)
+
+
+def position(pub_date, pk):
+    """Ключ поста в потоке: микросекунды с начала эпохи и id."""
+    return (pub_date - EPOCH) // MICROSECOND, pk
+
+
+def load_streams(author_ids):
+    """{id автора: поток} одним запросом на всех авторов.
+
+    Номер поста в потоке автора считает ROW_NUMBER(), так что база
+    отдаёт не больше STREAM_LENGTH постов каждого автора, а не всю
+    историю. В Django 2.2 Window на SQLite не поддерживается и оконное
+    выражение вписано через RawSQL, а отбор по номеру — обёрткой над
+    собранным запросом.
+    """
+    result = {pk: [] for pk in author_ids}
+    if not result:
+        return result
+    ranked = Post.visible.filter(author_id__in=result).annotate(
+        stream_rank=RawSQL(RANK_SQL.format(
+            table=connection.ops.quote_name(Post._meta.db_table)), ()),
+    ).order_by().values('author_id', 'pub_date', 'pk', 'stream_rank')
+    sql, params = ranked.query.sql_with_params()
+    posts = Post.objects.raw(
+        f'SELECT * FROM ({sql}) WHERE stream_rank <= %s '
+        'ORDER BY author_id, pub_date DESC, id DESC',
+        (*params, STREAM_LENGTH),
+    )
+    for post in posts:
+        result[post.author_id].append(position(post.pub_date, post.pk))
+    return result
+
+
+def streams(author_ids):
+    """{id автора: поток}: один get_many, промахи — из базы."""
+    keys = {STREAM_KEY.format(pk): pk for pk in author_ids}
+    result = {
+        keys[key]: value for key, value in get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in result]
+    if missing:
+        loaded = load_streams(missing)
+        set_many({
+            STREAM_KEY.format(pk): stream for pk, stream in loaded.items()
+        }, STREAM_TIMEOUT)
+        result.update(loaded)
+    return result
+
+
+def invalidate(author_id):
+    cache.delete(STREAM_KEY.format(author_id))
+
+
+def parse_cursor(value):
+    """Курсор 'время_id' из адреса или None."""
+    try:
+        micros, pk = (value or '').split('_')
+        return int(micros), int(pk)
+    except ValueError:
+        return None
+
+
+def format_cursor(cursor):
+    return '{}_{}'.format(*cursor)
+
+
+def merge_page(author_streams, cursor, size):
+    """Ключи постов страницы после cursor; None — потоков не хватило.
+
+    Обрезанный поток (STREAM_LENGTH записей) не знает о постах старше
+    своего хвоста, поэтому слияние ниже хвоста ненадёжно.
+    """
+    floor = max(
+        (stream[-1] for stream in author_streams
+         if len(stream) >= STREAM_LENGTH),
+        default=None,
+    )
+    if cursor is not None:
+        author_streams = [
+            (item for item in stream if item < cursor)
+            for stream in author_streams
+        ]
+    merged = list(islice(
+        heapq.merge(*author_streams, reverse=True), size + 1))
+    complete = merged if len(merged) > size else merged + [None]
+    if floor is not None and any(
+            item is None or item < floor for item in complete):
+        return None
+    return merged
+
+
+class CursorPage(Page):
+    """Страница ленты с курсором вместо номера."""
+    cursor_paging = True
+
+    def __init__(self, object_list, next_cursor):
+        super().__init__(object_list, 1, None)
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return False
+
+
+def sql_page(author_ids, cursor, size):
+    queryset = Post.visible.filter(author_id__in=author_ids)
+    if cursor is not None:
+        micros, pk = cursor
+        pub_date = EPOCH + micros * MICROSECOND
+        queryset = queryset.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+    posts = list(queryset.select_related('group', 'author').order_by(
+        '-pub_date', '-pk')[:size + 1])
+    return [position(post.pub_date, post.pk) for post in posts], {
+        post.pk: post for post in posts}
+
+
+def page(author_ids, cursor, size):
+    """CursorPage ленты подписок после курсора."""
+    merged = merge_page(list(streams(author_ids).values()), cursor, size)
+    if merged is None:
+        merged, posts = sql_page(author_ids, cursor, size)
+    else:
+        posts = Post.visible.select_related('group', 'author').in_bulk(
+            [pk for _, pk in merged[:size]])
+    next_cursor = None
+    if len(merged) > size:
+        next_cursor = format_cursor(merged[size - 1])
+    return CursorPage(
+        [posts[pk] for _, pk in merged[:size] if pk in posts],
+        next_cursor,
+    )
@@ -0,0 +1,81 @@
+"""Граф подписок в кэше.
+
+Для каждого пользователя храним два отсортированных массива id:
+на кого он подписан и кто подписан на него. Массивы загружаются
+лениво одним запросом и сбрасываются сигналами модели Follow,
+поэтому проверка подписки и счётчики обходятся без SQL.
+Загрузку одного ключа одновременно выполняет только один процесс.
+"""
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from core.cache import get_many, get_or_set, set_many
+
+from .models import Follow
+
+FOLLOWING_KEY = 'follow_graph:following:{}'
+FOLLOWERS_KEY = 'follow_graph:followers:{}'
+GRAPH_TIMEOUT = 60 * 60 * 24
+
+
+def _load(key, lookup, column, user_id):
+    return get_or_set(key, lambda: array('q', sorted(set(
+        Follow.objects.filter(**{lookup: user_id})
+        .values_list(column, flat=True)
+    ))), GRAPH_TIMEOUT)
+
+
+def following(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    return _load(
+        FOLLOWING_KEY.format(user_id), 'user_id', 'author_id', user_id)
+
+
+def followers(user_id):
+    """Отсортированный массив id подписчиков автора user_id."""
+    return _load(
+        FOLLOWERS_KEY.format(user_id), 'author_id', 'user_id', user_id)
+
+
+def is_following(user_id, author_id):
+    ids = following(user_id)
+    position = bisect_left(ids, author_id)
+    return position < len(ids) and ids[position] == author_id
+
+
+def following_count(user_id):
+    return len(following(user_id))
+
+
+def followers_count(user_id):
+    return len(followers(user_id))
+
+
+def followers_many(author_ids):
+    """{id автора: массив подписчиков} одним get_many и одним запросом."""
+    keys = {FOLLOWERS_KEY.format(pk): pk for pk in author_ids}
+    result = {
+        keys[key]: value for key, value in get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in result]
+    if missing:
+        loaded = defaultdict(set)
+        for author_id, user_id in Follow.objects.filter(
+                author_id__in=missing).values_list('author_id', 'user_id'):
+            loaded[author_id].add(user_id)
+        result.update(
+            (pk, array('q', sorted(loaded[pk]))) for pk in missing)
+        set_many({
+            FOLLOWERS_KEY.format(pk): result[pk] for pk in missing
+        }, GRAPH_TIMEOUT)
+    return result
+
+
+def invalidate(user_id, author_id):
+    """Сбрасывает массивы обеих сторон изменившейся подписки."""
+    cache.delete_many([
+        FOLLOWING_KEY.format(user_id),
+        FOLLOWERS_KEY.format(author_id),
+    ])
@@ -0,0 +1,249 @@
+"""Последние посты главной страницы в памяти процесса.
+
+Каждый процесс держит до INDEX_BUFFER_SIZE новейших постов главной
+ленты в кольцевом буфере (deque с maxlen) компактными записями со
+__slots__: поля поста, имя автора и название группы уже вписаны в
+запись. Страницы, которые целиком лежат в буфере, собираются из
+записей без запросов к базе; остальные читаются из базы как раньше.
+
+Новый и изменённый пост процесс вносит в свой буфер сам (сигнал
+post_save) и сообщает остальным, увеличивая счётчик GENERATION_KEY в
+кэше (cache.incr атомарен). Своим новое поколение процесс считает,
+только если до него счётчик не менял никто другой. Процесс, у которого
+поколение не совпало с кэшем, перечитывает буфер одним запросом при
+следующем обращении. Изменения внутри
+транзакции (в том числе удаление — Django всегда удаляет в
+транзакции) и массовые UPDATE (архив, фоновое удаление, смена имени
+автора или группы) не вносятся по месту, а только сбрасывают
+поколение — сразу и ещё раз после фиксации.
+"""
+import random
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Group, Post
+
+User = get_user_model()
+
+GENERATION_KEY = 'front_page:generation'
+
+
+class PostRecord:
+    __slots__ = (
+        'pk', 'text', 'pub_date', 'updated', 'image', 'author_id',
+        'username', 'first_name', 'last_name', 'group_id', 'group_title',
+        'group_slug',
+    )
+
+    def __init__(self, post):
+        self.pk = post.pk
+        self.text = post.text
+        self.pub_date = post.pub_date
+        self.updated = post.updated
+        self.image = post.image.name or ''
+        self.author_id = post.author_id
+        self.username = post.author.username
+        self.first_name = post.author.first_name
+        self.last_name = post.author.last_name
+        self.group_id = post.group_id
+        if post.group_id is not None:
+            self.group_title = post.group.title
+            self.group_slug = post.group.slug
+        else:
+            self.group_title = self.group_slug = None
+
+    @property
+    def key(self):
+        return self.pub_date, self.pk
+
+    def to_post(self):
+        """Пост для шаблонов без обращения к базе.
+
+        У автора и группы заполнены только поля записи, поэтому такие
+        посты помечены from_buffer и не попадают в кэш
+        (cached.prime_posts).
+        """
+        post = Post(
+            id=self.pk, text=self.text, pub_date=self.pub_date,
+            updated=self.updated, image=self.image,
+        )
+        post.author = User(
+            id=self.author_id, username=self.username,
+            first_name=self.first_name, last_name=self.last_name,
+        )
+        if self.group_id is not None:
+            post.group = Group(
+                id=self.group_id, title=self.group_title,
+                slug=self.group_slug,
+            )
+        post.from_buffer = True
+        for instance in (post, post.author, post.group):
+            if instance is not None:
+                instance._state.adding = False
+                instance._state.db = connection.alias
+        return post
+
+
+def is_listed(post):
+    """Попадает ли пост на главную (см. Post.visible.hot())."""
+    return not (post.hidden or post.archived or not post.author.is_active)
+
+
+class FrontPage:
+    def __init__(self, size):
+        self.size = size
+        self._records = deque(maxlen=size)
+        self._count = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _cached_generation(self):
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # Случайное начало: после очистки кэша старые номера
+            # процессов не совпадут с новым счётчиком.
+            cache.add(GENERATION_KEY, random.getrandbits(48), None)
+            generation = cache.get(GENERATION_KEY)
+        return generation
+
+    def _publish(self, adopt):
+        """Новое поколение для остальных процессов."""
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            self._cached_generation()
+            generation = None
+        # Чужое изменение, пришедшее раньше нашего, в буфере не учтено.
+        if (adopt and generation is not None
+                and self._generation is not None
+                and generation == self._generation + 1):
+            self._generation = generation
+        else:
+            self._generation = None
+
+    def _reload(self, generation):
+        posts = Post.visible.hot().select_related('author', 'group')
+        self._records = deque(
+            (PostRecord(post) for post in posts[:self.size]),
+            maxlen=self.size,
+        )
+        self._count = Post.visible.hot().count()
+        self._generation = generation
+
+    def _sync(self):
+        generation = self._cached_generation()
+        if generation is None or generation != self._generation:
+            self._reload(generation)
+
+    def window(self, start, stop):
+        """Записи [start:stop] ленты или None, если их нет в буфере."""
+        with self._lock:
+            self._sync()
+            if stop > len(self._records) and not self._covered():
+                return None
+            return [
+                self._records[index]
+                for index in range(start, min(stop, len(self._records)))
+            ]
+
+    def count(self):
+        with self._lock:
+            self._sync()
+            return self._count
+
+    def invalidate(self):
+        """Все процессы, включая этот, перечитают буфер."""
+        with self._lock:
+            self._publish(adopt=False)
+        if connection.in_atomic_block:
+            # Кто перечитал буфер до фиксации, перечитает и после.
+            transaction.on_commit(self.invalidate)
+
+    def _covered(self):
+        return len(self._records) == self._count
+
+    def _position(self, pk):
+        for index, record in enumerate(self._records):
+            if record.pk == pk:
+                return index
+        return None
+
+    def _apply_saved(self, post, created):
+        """Вносит сохранённый пост; False — нужно перечитать буфер."""
+        index = self._position(post.pk)
+        key = (post.pub_date, post.pk)
+        if not is_listed(post):
+            if index is not None:
+                del self._records[index]
+                self._count -= 1
+            return index is not None or created
+        if index is not None:
+            if self._records[index].key != key:
+                return False
+            self._records[index] = PostRecord(post)
+            return True
+        if not created:
+            return False
+        if self._records and key < self._records[0].key:
+            # Пост не новее всех: место в буфере ищется перечитыванием.
+            return False
+        self._records.appendleft(PostRecord(post))
+        self._count += 1
+        return True
+
+    def _notify(self, apply):
+        if connection.in_atomic_block:
+            # Транзакция ещё может откатиться: вместо правки по месту
+            # буферы перечитываются сейчас и после фиксации.
+            self.invalidate()
+            return
+        with self._lock:
+            applied = self._generation is not None and apply()
+            self._publish(adopt=applied)
+
+    def post_saved(self, post, created):
+        self._notify(lambda: self._apply_saved(post, created))
+
+    def post_deleted(self, post):
+        # Django удаляет в транзакции, так что правки по месту не будет.
+        self.invalidate()
+
+
+class BufferedPosts:
+    """Лента главной для Paginator: срезы из буфера или из базы."""
+
+    def __init__(self, buffer, queryset):
+        self.buffer = buffer
+        self.queryset = queryset
+
+    def count(self):
+        return self.buffer.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        records = None
+        if stop is not None and index.step is None:
+            records = self.buffer.window(start, stop)
+        if records is None:
+            return list(self.queryset[index])
+        return [record.to_post() for record in records]
+
+
+buffer = FrontPage(getattr(settings, 'INDEX_BUFFER_SIZE', 100))
+
+
+def posts(queryset):
+    """Главная лента: из буфера процесса, если он включён."""
+    if not buffer.size:
+        return queryset
+    return BufferedPosts(buffer, queryset)
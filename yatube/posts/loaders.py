@@ -0,0 +1,39 @@
+"""Источники данных для загрузчика запроса (core.loader).
+
+Ключи — id авторов и постов. Каждый вид загружается для всей
+страницы сразу: одним запросом к базе или одним get_many к кэшу.
+"""
+from core import loader
+
+from . import cached, follow_graph, reactions
+
+
+def posts_counts(request_loader, author_ids):
+    return cached.posts_counts(author_ids)
+
+
+def followers_counts(request_loader, author_ids):
+    return {
+        author_id: len(ids)
+        for author_id, ids in follow_graph.followers_many(
+            author_ids).items()
+    }
+
+
+def following(request_loader, author_ids):
+    """Подписан ли пользователь запроса на авторов: один ключ кэша."""
+    user = request_loader.user
+    if user is None or not user.is_authenticated:
+        return dict.fromkeys(author_ids, False)
+    ids = set(follow_graph.following(user.id))
+    return {author_id: author_id in ids for author_id in author_ids}
+
+
+def reaction_counts(request_loader, post_ids):
+    return reactions.counts(post_ids)
+
+
+loader.register('posts_count', posts_counts)
+loader.register('followers_count', followers_counts)
+loader.register('following', following)
+loader.register('reactions', reaction_counts)
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import front_page
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты в архив: они пропадают из лент.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365),
+            help='Архивировать посты старше стольких дней.',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=500,
+            help='Сколько постов архивировать за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = Post.objects.filter(archived=False, pub_date__lt=cutoff)
+        archived = 0
+        while True:
+            ids = list(old.values_list('pk', flat=True)[:options['batch']])
+            if not ids:
+                break
+            # Короткие транзакции не держат базу заблокированной.
+            with transaction.atomic():
+                archived += Post.objects.filter(pk__in=ids).update(
+                    archived=True)
+        if archived:
+            front_page.buffer.invalidate()
+        self.stdout.write(f'Перенесено в архив: {archived}')
@@ -0,0 +1,104 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.template import engines
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+
+from posts.models import Group, Post
+from posts.views import AMOUNT
+
+User = get_user_model()
+
+ENGINES = ('django', 'jinja2')
+# Без кэша фрагменты и карточки рисуются на каждом проходе.
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время отрисовки шаблонов лент в Django-шаблонах и '
+        'в Jinja2 на временных данных, без кэша карточек и фрагментов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Сколько раз отрисовать каждый шаблон.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(), override_settings(CACHES=NO_CACHE):
+                self.run(*self.populate(), options['repeat'])
+                # Данные для замеров не остаются в базе.
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self):
+        suffix = random.randrange(10 ** 9)
+        author = User.objects.create_user(
+            username=f'bench{suffix}', first_name='Имя', last_name='Автор')
+        group = Group.objects.create(
+            title='Группа', slug=f'bench{suffix}', description='Описание')
+        Post.objects.bulk_create(
+            Post(author=author, group=group, text=f'Текст поста {i}')
+            for i in range(AMOUNT)
+        )
+        return author, group
+
+    def run(self, author, group, repeat):
+        posts = list(Post.objects.filter(author=author).select_related(
+            'author', 'group'))
+        page_obj = Paginator(posts, AMOUNT).get_page(1)
+        contexts = {
+            'posts/index.html': {
+                'title': 'Последние обновления на сайте',
+                'page_obj': page_obj,
+                'follow_marks': None,
+            },
+            'posts/group_list.html': {
+                'group': group,
+                'title': f'Записи сообщества {group}',
+                'page_obj': page_obj,
+            },
+            'posts/profile.html': {
+                'author': author,
+                'page_obj': page_obj,
+                'posts_count': AMOUNT,
+                'followers_count': 0,
+            },
+            'posts/follow.html': {'page_obj': page_obj},
+        }
+        factory = RequestFactory()
+        for name, context in contexts.items():
+            timings = {}
+            for engine in ENGINES:
+                template = engines[engine].get_template(name)
+                # Карточки постов рисует тот же движок.
+                with override_settings(FEED_TEMPLATE_ENGINE=engine):
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        request = factory.get('/')
+                        request.user = AnonymousUser()
+                        request.resolver_match = resolve('/')
+                        template.render(dict(context), request)
+                timings[engine] = (
+                    (time.perf_counter() - start) / repeat * 1000)
+            self.stdout.write(
+                f'{name}: django {timings["django"]:.2f} мс, '
+                f'jinja2 {timings["jinja2"]:.2f} мс, '
+                f'быстрее в {timings["django"] / timings["jinja2"]:.1f} раза')
@@ -0,0 +1,168 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts import follow_feed, follow_graph
+from posts.models import Follow, Post
+from posts.views import AMOUNT
+
+User = get_user_model()
+
+CHUNK = 300
+
+
+class Rollback(Exception):
+    pass
+
+
+def measure(fetch, repeat):
+    """Среднее время в мс и число запросов одного вызова fetch."""
+    with CaptureQueriesContext(connection) as queries:
+        fetch()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fetch()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    return elapsed, len(queries)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает движки ленты подписок на временных данных: '
+        'JOIN в базе и слияние кэшированных потоков авторов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--authors', type=int, default=200,
+            help='На сколько авторов подписан читатель.',
+        )
+        parser.add_argument(
+            '--posts', type=int, default=30,
+            help='Сколько постов у каждого автора.',
+        )
+        parser.add_argument(
+            '--long-authors', type=int, default=10,
+            help='У скольких авторов длинная история постов.',
+        )
+        parser.add_argument(
+            '--long-posts', type=int, default=2000,
+            help='Сколько постов у автора с длинной историей.',
+        )
+        parser.add_argument(
+            '--pages', type=int, default=5,
+            help='Сколько страниц ленты пролистать.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить каждое измерение.',
+        )
+
+    def handle(self, *args, **options):
+        users = []
+        try:
+            with transaction.atomic():
+                users = self.populate(options)
+                self.run(users[0], options)
+                # Данные для замеров не остаются в базе.
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            cache.delete_many(
+                [follow_feed.STREAM_KEY.format(user.pk) for user in users]
+                + [follow_graph.FOLLOWING_KEY.format(user.pk)
+                   for user in users]
+                + [follow_graph.FOLLOWERS_KEY.format(user.pk)
+                   for user in users]
+            )
+
+    def populate(self, options):
+        prefix = f'bench{random.randrange(10 ** 9)}'
+        User.objects.bulk_create(
+            User(username=f'{prefix}_{i}')
+            for i in range(options['authors'] + 1)
+        )
+        users = list(User.objects.filter(
+            username__startswith=prefix + '_').order_by('pk'))
+        reader, authors = users[0], users[1:]
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for author in authors)
+        prolific = authors[:options['long_authors']]
+        Post.objects.bulk_create(
+            Post(author=author, text='Текст')
+            for author in authors for _ in range(options['posts'])
+        )
+        # Холодный кэш не должен читать всю историю плодовитых авторов.
+        Post.objects.bulk_create(
+            Post(author=author, text='Текст')
+            for author in prolific
+            for _ in range(options['long_posts'] - options['posts'])
+        )
+        # bulk_create ставит всем постам одно время публикации.
+        now = timezone.now()
+        ids = list(Post.objects.filter(
+            author__in=authors).values_list('pk', flat=True))
+        for start in range(0, len(ids), CHUNK):
+            chunk = ids[start:start + CHUNK]
+            Post.objects.filter(pk__in=chunk).update(pub_date=Case(
+                *[When(pk=pk, then=Value(
+                    now - timedelta(seconds=random.randrange(10 ** 7))))
+                  for pk in chunk],
+                output_field=DateTimeField(),
+            ))
+        return users
+
+    def run(self, reader, options):
+        author_ids = follow_graph.following(reader.pk)
+        pages, repeat = options['pages'], options['repeat']
+        queryset = Post.visible.filter(
+            author_id__in=author_ids).select_related('group', 'author')
+
+        def sql_page(number):
+            return lambda: list(
+                Paginator(queryset, AMOUNT).get_page(number))
+
+        def merge_page(cursor):
+            return lambda: follow_feed.page(author_ids, cursor, AMOUNT)
+
+        def drop_streams():
+            cache.delete_many([
+                follow_feed.STREAM_KEY.format(pk) for pk in author_ids])
+
+        def cold():
+            drop_streams()
+            follow_feed.page(author_ids, None, AMOUNT)
+
+        self.stdout.write(
+            f'Авторов: {len(author_ids)}, постов у автора: '
+            f'{options["posts"]}, из них у {options["long_authors"]}: '
+            f'{options["long_posts"]}, страниц: {pages}')
+        for number in range(1, pages + 1):
+            elapsed, queries = measure(sql_page(number), repeat)
+            self.report('sql', number, elapsed, queries)
+        elapsed, queries = measure(cold, repeat)
+        self.report('merge, холодный кэш', 1, elapsed, queries)
+        cursor = None
+        for number in range(1, pages + 1):
+            elapsed, queries = measure(merge_page(cursor), repeat)
+            self.report('merge', number, elapsed, queries)
+            next_cursor = follow_feed.page(
+                author_ids, cursor, AMOUNT).next_cursor
+            if next_cursor is None:
+                break
+            cursor = follow_feed.parse_cursor(next_cursor)
+
+    def report(self, engine, number, elapsed, queries):
+        self.stdout.write(
+            f'{engine}: страница {number}: {elapsed:.2f} мс, '
+            f'запросов {queries}')
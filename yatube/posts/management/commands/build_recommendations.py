@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации «на кого подписаться».'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=recommendations.TOP_K,
+            help='Сколько авторов рекомендовать каждому пользователю.',
+        )
+
+    def handle(self, *args, **options):
+        count = recommendations.build(k=options['top'])
+        self.stdout.write(f'Сохранено рекомендаций: {count}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет трендовые таблицы из кэша в базу.'
+
+    def handle(self, *args, **options):
+        trending.checkpoint()
+        self.stdout.write('Трендовые таблицы сохранены')
@@ -0,0 +1,158 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.storage import walk_sorted
+from posts.models import Post
+
+UPLOAD_DIR = 'posts/'
+
+
+def referenced_names(chunk_size):
+    """Имена картинок из базы по возрастанию, потоком."""
+    return ordered(
+        Post.objects.exclude(image='').order_by('image')
+        .values_list('image', flat=True).distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def ordered(names):
+    """Пропускает names, проверяя, что они идут по возрастанию."""
+    previous = ''
+    for name in names:
+        # Слияние верно только при побайтовом порядке строк (BINARY
+        # в SQLite); при другой сортировке удалили бы живые файлы.
+        if name < previous:
+            raise CommandError(
+                'База сортирует имена не побайтово, слияние невозможно')
+        previous = name
+        yield name
+
+
+def orphans(files, referenced):
+    """Файлы, которых нет среди referenced; оба потока отсортированы."""
+    referenced = iter(referenced)
+    current = next(referenced, None)
+    for name in files:
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if name != current:
+            yield name
+
+
+def thumbnails(image):
+    """Миниатюры sorl для картинки по записям kvstore."""
+    keys = default.kvstore._get(image.key, identity='thumbnails') or []
+    return [
+        thumbnail for thumbnail in map(default.kvstore._get, keys)
+        if thumbnail is not None
+    ]
+
+
+def forget(images):
+    """Удаляет из kvstore записи о картинках и их миниатюрах."""
+    for image in images:
+        for thumbnail in thumbnails(image):
+            default.kvstore.delete(thumbnail, delete_thumbnails=False)
+        default.kvstore._delete(image.key, identity='thumbnails')
+        default.kvstore.delete(image, delete_thumbnails=False)
+
+
+def is_old(path, cutoff):
+    """Файл старше cutoff; пропавший во время обхода — нет."""
+    try:
+        return os.path.getmtime(path) < cutoff
+    except FileNotFoundError:
+        return False
+
+
+def delete_files(files):
+    for file in files:
+        file.storage.delete(file.name)
+    return len(files)
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки постов, на которые больше нет ссылок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только перечислить файлы-сироты.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число потоков, удаляющих файлы.',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=100,
+            help='Сколько файлов удаляет поток за одну задачу.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе этого числа секунд: '
+                 'пост с только что загруженной картинкой мог ещё '
+                 'не сохраниться.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        root = storage.path(UPLOAD_DIR)
+        cutoff = time.time() - options['min_age']
+        # Список сирот собирается целиком до первого удаления: проверка
+        # порядка имён в referenced_names должна успеть остановить
+        # команду, пока ни один файл не тронут.
+        found = [
+            name for name in orphans(
+                (UPLOAD_DIR + name for name in walk_sorted(root)),
+                referenced_names(options['batch']),
+            )
+            if is_old(storage.path(name), cutoff)
+        ]
+        if options['dry_run']:
+            for name in found:
+                self.stdout.write(name)
+            self.stdout.write(f'Файлов-сирот: {len(found)}')
+            return
+        deleted = 0
+        pending = {}
+        with ThreadPoolExecutor(options['workers']) as pool:
+            for images in self.batches(storage, found, options['batch']):
+                # Не держим в очереди больше двух задач на поток.
+                if len(pending) >= options['workers'] * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    deleted += self.finish(done, pending)
+                files = [
+                    file for image in images
+                    for file in [image] + thumbnails(image)
+                ]
+                pending[pool.submit(delete_files, files)] = images
+            deleted += self.finish(list(pending), pending)
+        self.stdout.write(f'Удалено картинок: {deleted}')
+
+    def batches(self, storage, names, size):
+        batch = []
+        for name in names:
+            batch.append(ImageFile(name, storage))
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def finish(self, futures, pending):
+        # Записи kvstore убираются только после удаления файлов:
+        # иначе при сбое миниатюры остались бы без ссылок на них.
+        # С базой работает только основной поток.
+        deleted = 0
+        for future in futures:
+            future.result()
+            images = pending.pop(future)
+            forget(images)
+            deleted += len(images)
+        return deleted
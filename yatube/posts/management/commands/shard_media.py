@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.storage import is_sharded, shard_name
+from posts.models import Post
+
+
+MOVED, FOUND, CLASH, MISSING = 'moved', 'found', 'clash', 'missing'
+
+
+def _claim(source_path, target_path):
+    """Ссылка target на source; False, если target уже занят."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except FileExistsError:
+        return os.path.samefile(source_path, target_path)
+    return True
+
+
+def move(storage, name):
+    """Переносит файл в каталог шарда; возвращает (итог, новое имя).
+
+    Путь вычисляется без соли, поэтому после сбоя между переносом
+    и записью в базу повторный запуск найдёт файл на новом месте
+    (итог FOUND). Если путь занят чужим файлом — новые загрузки с
+    солью попадают в те же каталоги, — файл не трогается (CLASH).
+    """
+    target = shard_name(name)
+    source_path, target_path = storage.path(name), storage.path(target)
+    if not os.path.exists(source_path):
+        return (FOUND if os.path.exists(target_path) else MISSING), target
+    if not _claim(source_path, target_path):
+        return CLASH, target
+    os.remove(source_path)
+    return MOVED, target
+
+
+def move_aside(storage, pk, name, target):
+    """Переносит файл под свободным именем рядом с занятым target.
+
+    Имя не вычисляется заново, поэтому запись в базе обновляется
+    до удаления старого файла.
+    """
+    target = storage.get_available_name(target)
+    if not _claim(storage.path(name), storage.path(target)):
+        return None
+    Post.objects.filter(pk=pk, image=name).update(
+        image=target, updated=timezone.now())
+    os.remove(storage.path(name))
+    return target
+
+
+class Command(BaseCommand):
+    help = 'Раскладывает старые картинки постов по каталогам-шардам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch', type=int, default=500,
+            help='Сколько постов обновлять за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Число потоков, переносящих файлы.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, сколько файлов нужно перенести.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        queryset = Post.objects.exclude(image='').order_by('pk')
+        moved = missing = 0
+        last_pk = 0
+        with ThreadPoolExecutor(options['workers']) as pool:
+            while True:
+                rows = list(
+                    queryset.filter(pk__gt=last_pk)
+                    .values_list('pk', 'image')[:options['batch']]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                rows = [row for row in rows if not is_sharded(row[1])]
+                if options['dry_run']:
+                    moved += len(rows)
+                    continue
+                results = pool.map(lambda row: move(storage, row[1]), rows)
+                updates = []
+                for (pk, image), (result, name) in zip(rows, results):
+                    if result == CLASH:
+                        if move_aside(storage, pk, image, name):
+                            moved += 1
+                        continue
+                    if result == FOUND and Post.objects.filter(
+                            image=name).exclude(pk=pk).exists():
+                        # На месте шарда чужой файл, а нашего нет.
+                        result = MISSING
+                    if result == MISSING:
+                        missing += 1
+                        continue
+                    updates.append((pk, image, name))
+                now = timezone.now()
+                with transaction.atomic():
+                    for pk, image, name in updates:
+                        # Автор мог заменить картинку после выборки:
+                        # новая загрузка не затирается старым путём.
+                        # updated меняет ключ кэша карточки со ссылкой
+                        # на миниатюру старого пути.
+                        moved += Post.objects.filter(
+                            pk=pk, image=image,
+                        ).update(image=name, updated=now)
+                self.stdout.write(f'Обработаны посты до id={last_pk}')
+        verb = 'Нужно перенести' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(f'{verb} файлов: {moved}, не найдено: {missing}')
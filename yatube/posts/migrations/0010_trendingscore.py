@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:51
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ShardedFileSystemStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
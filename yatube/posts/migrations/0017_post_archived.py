@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_views'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='archived',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(archived=False), fields=['-pub_date'], name='post_hot_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(archived=False), fields=['group', '-pub_date'], name='post_hot_group_idx'),
+        ),
+    ]
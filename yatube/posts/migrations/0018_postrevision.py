@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_archived'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('snapshot', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='posts.Post')),
+            ],
+            options={
+                'ordering': ('post', 'number'),
+                'unique_together': {('post', 'number')},
+            },
+        ),
+    ]
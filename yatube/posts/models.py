@@ -1,12 +1,31 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Substr
+
+from core.storage import ShardedFileSystemStorage
 
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def hot(self):
+        """Только неархивные посты: их покрывают частичные индексы."""
+        return self.filter(archived=False)
+
+
+class VisiblePostManager(models.Manager.from_queryset(PostQuerySet)):
+    """Посты без скрытых и без постов неактивных авторов."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            hidden=False, author__is_active=True)
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -22,25 +41,94 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ShardedFileSystemStorage(),
         blank=True
     )
+    # Пост ждёт фонового удаления (см. core.deletion).
+    hidden = models.BooleanField(default=False)
+    # Пишется пачками из posts.viewcounts.
+    views = models.PositiveIntegerField(default=0, editable=False)
+    # Старые посты уходят из лент (команда archive_posts).
+    archived = models.BooleanField(default=False, editable=False)
+
+    objects = models.Manager.from_queryset(PostQuerySet)()
+    # Для лент и страниц сайта; админка и связи видят все посты.
+    visible = VisiblePostManager()
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # views пишет только viewcounts через F(): полное сохранение
+        # (форма, админка) затёрло бы просмотры, сброшенные после
+        # загрузки поста.
+        if not self._state.adding and not kwargs.get('force_insert') and (
+                kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'views'
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date', )
+        # Ленты читают только горячую часть: индексы не растут с архивом.
+        indexes = [
+            models.Index(
+                fields=['-pub_date'],
+                name='post_hot_feed_idx',
+                condition=Q(archived=False),
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_hot_group_idx',
+                condition=Q(archived=False),
+            ),
+        ]
 
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    hidden = models.BooleanField(default=False)
 
     def __str__(self):
         return self.title
 
 
+# Сегмент материализованного пути: id комментария фиксированной
+# ширины и разделитель, поэтому сортировка по path даёт обход дерева
+# в глубину, а поддерево — диапазон [path, path + PATH_END).
+PATH_SEGMENT = '{:010d}/'
+PATH_STEP = 11
+PATH_END = '~'
+MAX_DEPTH = 20
+
+
+class CommentQuerySet(models.QuerySet):
+    def thread(self, post, max_depth=None):
+        """Все комментарии поста в порядке дерева, новые ветки сверху."""
+        queryset = self.filter(post=post).order_by(
+            Substr('path', 1, PATH_STEP).desc(), 'path')
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=max_depth)
+        return queryset
+
+    def subtree(self, comment, max_depth=None):
+        """Комментарий и его ответы одним запросом по диапазону path."""
+        queryset = self.filter(
+            post_id=comment.post_id,
+            path__gte=comment.path,
+            path__lt=comment.path + PATH_END,
+        ).order_by('path')
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=comment.depth + max_depth)
+        return queryset
+
+
 class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
@@ -56,12 +144,57 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name='comments'
     )
+    parent = models.ForeignKey(
+        'self',
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='replies'
+    )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Число всех ответов в поддереве, без самого комментария.
+    descendants = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    def ancestor_ids(self):
+        return [
+            int(self.path[start:start + PATH_STEP - 1])
+            for start in range(0, len(self.path) - PATH_STEP, PATH_STEP)
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
+        parent = self.parent
+        if parent is not None and parent.depth >= MAX_DEPTH:
+            # Слишком глубокий ответ становится соседом родителя.
+            self.parent_id = parent.parent_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if parent is None:
+                self.path, self.depth = PATH_SEGMENT.format(self.pk), 0
+            else:
+                base = parent.path
+                if parent.depth >= MAX_DEPTH:
+                    base = base[:-PATH_STEP]
+                self.path = base + PATH_SEGMENT.format(self.pk)
+                self.depth = len(base) // PATH_STEP
+            Comment.objects.filter(pk=self.pk).update(
+                path=self.path, depth=self.depth)
+            ancestors = self.ancestor_ids()
+            if ancestors:
+                Comment.objects.filter(pk__in=ancestors).update(
+                    descendants=F('descendants') + 1)
+
     class Meta:
         ordering = ('-created', )
+        base_manager_name = 'objects'
+        indexes = [models.Index(fields=['post', 'path'])]
 
 
 class Follow(models.Model):
@@ -80,3 +213,118 @@ class Follow(models.Model):
 
     def __str__(self):
         return self.text[:15]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommended_to'
+    )
+    score = models.FloatField()
+
+    def __str__(self):
+        return f'{self.user} -> {self.author}'
+
+    class Meta:
+        ordering = ('-score', )
+        unique_together = ('user', 'author')
+
+
+class TrendingScore(models.Model):
+    kind = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}'
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+
+class ReactionQuerySet(models.QuerySet):
+    def delete(self):
+        """Удаляет реакции и вычитает их из счётчиков постов."""
+        from .reactions import record
+        removed = list(self.values_list('post_id', 'kind'))
+        result = super().delete()
+        for post_id, kind in removed:
+            record(post_id, kind, -1)
+        return result
+
+
+class Reaction(models.Model):
+    LIKE = 'like'
+    HEART = 'heart'
+    LAUGH = 'laugh'
+    KIND_CHOICES = (
+        (LIKE, '👍'),
+        (HEART, '❤️'),
+        (LAUGH, '😄'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='reactions'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='reactions'
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ReactionQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.user} {self.kind} {self.post_id}'
+
+    class Meta:
+        base_manager_name = 'objects'
+        unique_together = ('user', 'post')
+
+
+class ReactionCounter(models.Model):
+    """Часть счётчика реакций; сумма по shard — полное число."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='reaction_counters'
+    )
+    kind = models.CharField(max_length=10)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.post_id}:{self.kind}:{self.shard}'
+
+    class Meta:
+        unique_together = ('post', 'kind', 'shard')
+
+
+class PostRevision(models.Model):
+    """Версия текста поста: снимок или дельта (см. posts.revisions)."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='revisions'
+    )
+    number = models.PositiveIntegerField()
+    snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.post_id}#{self.number}'
+
+    class Meta:
+        ordering = ('post', 'number')
+        unique_together = ('post', 'number')
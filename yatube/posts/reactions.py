@@ -0,0 +1,109 @@
+"""Реакции на посты и их счётчики.
+
+Сама реакция — строка Reaction, уникальная для пары (пользователь,
+пост). Счётчики по видам реакций разбиты на SHARDS строк
+ReactionCounter: приращения копятся в памяти (core.counters) и
+сбрасываются пачкой в случайный шард, так что одновременные сбросы
+разных процессов для горячего поста обычно пишут в разные строки.
+Число реакций — сумма по шардам плюс ещё не сброшенные приращения
+своего процесса.
+"""
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from core.counters import BufferedCounter
+
+from .models import Post, Reaction, ReactionCounter
+
+SHARDS = 8
+KINDS = Reaction.KIND_CHOICES
+
+
+def flush(deltas):
+    shard = random.randrange(SHARDS)
+    existing = set(Post.objects.filter(
+        pk__in={post_id for post_id, _ in deltas}
+    ).values_list('pk', flat=True))
+    with transaction.atomic():
+        for (post_id, kind), delta in deltas.items():
+            if post_id not in existing:
+                continue
+            counter = ReactionCounter.objects.filter(
+                post_id=post_id, kind=kind, shard=shard)
+            if counter.update(count=F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    ReactionCounter.objects.create(
+                        post_id=post_id, kind=kind, shard=shard,
+                        count=delta)
+            except IntegrityError:
+                # Строку шарда успел создать другой процесс.
+                counter.update(count=F('count') + delta)
+
+
+buffer = BufferedCounter(
+    flush,
+    interval=getattr(settings, 'REACTIONS_FLUSH_INTERVAL', 5),
+)
+
+
+def record(post_id, kind, delta):
+    """Учитывает приращение после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: buffer.add((post_id, kind), delta))
+
+
+def toggle(user, post, kind):
+    """Ставит реакцию kind; повторная такая же реакция снимается."""
+    with transaction.atomic():
+        current = Reaction.objects.select_for_update().filter(
+            user=user, post=post).first()
+        if current is None:
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(user=user, post=post, kind=kind)
+            except IntegrityError:
+                # Двойной клик: реакция уже поставлена.
+                return
+            record(post.pk, kind, 1)
+        elif current.kind == kind:
+            Reaction.objects.filter(pk=current.pk).delete()
+        else:
+            Reaction.objects.filter(pk=current.pk).update(kind=kind)
+            record(post.pk, current.kind, -1)
+            record(post.pk, kind, 1)
+
+
+def counts(post_ids):
+    """{id поста: Counter по видам} одним запросом."""
+    post_ids = set(post_ids)
+    totals = defaultdict(Counter)
+    rows = ReactionCounter.objects.filter(post_id__in=post_ids).values(
+        'post_id', 'kind').annotate(total=Sum('count'))
+    for row in rows:
+        totals[row['post_id']][row['kind']] += row['total']
+    for (post_id, kind), delta in buffer.pending().items():
+        if post_id in post_ids:
+            totals[post_id][kind] += delta
+    return totals
+
+
+def attach(posts, totals=None):
+    """Кладёт в post.reaction_counts пары (значок, число) для шаблона.
+
+    totals — уже загруженный результат counts для этих постов.
+    """
+    if totals is None:
+        totals = counts(post.pk for post in posts)
+    for post in posts:
+        post_totals = totals.get(post.pk) or Counter()
+        post.reaction_counts = [
+            (kind, label, post_totals[kind])
+            for kind, label in KINDS
+            if post_totals[kind] > 0
+        ]
+    return posts
@@ -0,0 +1,102 @@
+"""История правок текста постов.
+
+Текущий текст всегда лежит в Post.text, история — в PostRevision.
+Версия 0 — текст до первой правки, версия n — текст после n-й.
+Каждая SNAPSHOT_EVERY-я версия хранится целиком, остальные — дельтой
+к предыдущей версии: список кусков, где пара [i, j] копирует слова
+i..j-1 предыдущего текста, а строка вставляется как есть. И снимки,
+и дельты сжаты zlib. Любая версия собирается одним запросом не более
+чем из SNAPSHOT_EVERY строк: ближайший снимок и дельты после него.
+
+Посты, которые ни разу не правили, истории не имеют.
+"""
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.db import transaction
+
+from .models import PostRevision
+
+SNAPSHOT_EVERY = 10
+
+TOKEN = re.compile(r'\s+|\S+')
+
+
+def tokens(text):
+    return TOKEN.findall(text)
+
+
+def make_delta(old, new):
+    old_tokens, new_tokens = tokens(old), tokens(new)
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    delta = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append([i1, i2])
+        elif j1 != j2:
+            delta.append(''.join(new_tokens[j1:j2]))
+    return delta
+
+
+def apply_delta(old, delta):
+    old_tokens = tokens(old)
+    return ''.join(
+        piece if isinstance(piece, str) else ''.join(old_tokens[slice(*piece)])
+        for piece in delta
+    )
+
+
+def pack(value):
+    return zlib.compress(
+        json.dumps(value, ensure_ascii=False).encode(), 9)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode())
+
+
+def record(post, old_text):
+    """Добавляет версию post.text; old_text — текст до правки."""
+    if old_text == post.text:
+        return None
+    with transaction.atomic():
+        last = PostRevision.objects.select_for_update().filter(
+            post=post).order_by('-number').first()
+        if last is None:
+            PostRevision.objects.create(
+                post=post, number=0, snapshot=True, data=pack(old_text))
+            number = 1
+        else:
+            number = last.number + 1
+        snapshot = number % SNAPSHOT_EVERY == 0
+        data = post.text if snapshot else make_delta(old_text, post.text)
+        return PostRevision.objects.create(
+            post=post, number=number, snapshot=snapshot, data=pack(data))
+
+
+def text_at(post, number):
+    """Текст поста в версии number; None, если такой версии нет."""
+    base = number - number % SNAPSHOT_EVERY
+    rows = PostRevision.objects.filter(
+        post=post, number__gte=base, number__lte=number,
+    ).order_by('number').values_list('number', 'snapshot', 'data')
+    text = None
+    for row_number, snapshot, data in rows:
+        value = unpack(data)
+        text = value if snapshot else apply_delta(text, value)
+    if text is None or row_number != number:
+        return None
+    return text
+
+
+def history(post):
+    """Пары (версия, текст) от первой до последней за один проход."""
+    text = None
+    result = []
+    for revision in PostRevision.objects.filter(post=post).order_by('number'):
+        value = unpack(revision.data)
+        text = value if revision.snapshot else apply_delta(text, value)
+        result.append((revision, text))
+    return result
@@ -0,0 +1,141 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.jobs import enqueue
+
+from . import cached, follow_feed, follow_graph, front_page, revisions
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Поля автора, которые видны в карточке поста.
+CARD_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    follow_graph.invalidate(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def post_text_changing(sender, instance, update_fields=None, **kwargs):
+    """Запоминает текст до правки для истории (posts.revisions)."""
+    if instance.pk is None:
+        return
+    if update_fields is not None and 'text' not in update_fields:
+        return
+    instance._previous_text = Post.objects.filter(
+        pk=instance.pk).values_list('text', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    follow_feed.invalidate(instance.author_id)
+    front_page.buffer.post_saved(instance, created)
+    previous = instance.__dict__.pop('_previous_text', None)
+    if previous is not None:
+        revisions.record(instance, previous)
+    if created:
+        cache.delete(cached.POSTS_COUNT_KEY.format(instance.author_id))
+        enqueue('posts.trending', {
+            'event': 'post', 'post_id': instance.pk, 'at': time.time()})
+    if instance.image:
+        enqueue(
+            'posts.warm_thumbnail',
+            {'post_id': instance.pk},
+            dedup_key=f'warm_thumbnail:{instance.pk}',
+        )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    cache.delete(cached.POSTS_COUNT_KEY.format(instance.author_id))
+    follow_feed.invalidate(instance.author_id)
+    front_page.buffer.post_deleted(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """Счётчики ответов предков при любом удалении, в том числе каскадом.
+
+    Каждый удалённый комментарий поддерева вычитает у предков по одному.
+    """
+    ancestors = instance.ancestor_ids()
+    if ancestors:
+        Comment.objects.filter(pk__in=ancestors).update(
+            descendants=F('descendants') - 1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created and instance.post_id is not None:
+        enqueue('posts.trending', {
+            'event': 'comment', 'post_id': instance.post_id,
+            'at': time.time()})
+
+
+@receiver(pre_save, sender=User)
+def author_renamed(sender, instance, update_fields=None, **kwargs):
+    """При смене имени автора карточки его постов устаревают."""
+    if instance.pk is None:
+        return
+    watched = CARD_USER_FIELDS + ('is_active',)
+    if update_fields is not None and not set(update_fields) & set(watched):
+        return
+    old = User.objects.filter(pk=instance.pk).values(*watched).first()
+    if old and old['is_active'] != instance.is_active:
+        # Посты автора появятся на главной или пропадут с неё.
+        instance._activity_changed = True
+    if old and old['username'] != instance.username:
+        cache.delete(cached.USER_KEY.format(old['username']))
+    if old and any(
+            old[field] != getattr(instance, field)
+            for field in CARD_USER_FIELDS):
+        enqueue(
+            'posts.touch_author_posts',
+            {'author_id': instance.pk},
+            dedup_key=f'touch_author_posts:{instance.pk}',
+        )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    cache.delete(cached.USER_KEY.format(instance.username))
+    if instance.__dict__.pop('_activity_changed', False):
+        front_page.buffer.invalidate()
+        # Поток неактивного автора закэширован пустым.
+        follow_feed.invalidate(instance.pk)
+
+
+@receiver(pre_save, sender=Group)
+def group_renamed(sender, instance, **kwargs):
+    """Запись по старому slug сбрасывается при его смене."""
+    if instance.pk is None:
+        return
+    old_slug = Group.objects.filter(
+        pk=instance.pk).values_list('slug', flat=True).first()
+    if old_slug is not None and old_slug != instance.slug:
+        cache.delete(cached.GROUP_KEY.format(old_slug))
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, created, **kwargs):
+    cache.delete(cached.GROUP_KEY.format(instance.slug))
+    if not created:
+        enqueue(
+            'posts.touch_group_posts',
+            {'group_id': instance.pk},
+            dedup_key=f'touch_group_posts:{instance.pk}',
+        )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    cache.delete(cached.GROUP_KEY.format(instance.slug))
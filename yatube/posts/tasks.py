@@ -0,0 +1,63 @@
+"""Фоновые задачи, которые ставятся при сохранении постов и комментариев."""
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from core.jobs import enqueue, job
+
+from . import front_page, trending
+from .models import Post
+
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+@job('posts.warm_thumbnail')
+def warm_thumbnail(payload):
+    """Заранее готовит миниатюру, чтобы её не резала первая лента."""
+    post = Post.objects.filter(pk=payload['post_id']).first()
+    if post is not None and post.image:
+        get_thumbnail(post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS)
+
+
+@job('posts.trending', batch=True)
+def update_trending(payloads):
+    posts = Post.visible.in_bulk({item['post_id'] for item in payloads})
+    events = []
+    for item in payloads:
+        post = posts.get(item['post_id'])
+        if post is None:
+            continue
+        if item['event'] == 'comment':
+            weight = trending.COMMENT_WEIGHT
+        else:
+            weight = trending.POST_WEIGHT
+        events += trending.events(post, weight, item['at'])
+    # Вся пачка применяется одной записью под блокировкой таблиц.
+    trending.record(events)
+    enqueue(
+        'posts.checkpoint_trending',
+        dedup_key='checkpoint_trending',
+        delay=trending.CHECKPOINT_INTERVAL,
+    )
+
+
+@job('posts.checkpoint_trending')
+def checkpoint_trending(payload):
+    """Сохраняет трендовые таблицы, чтобы вытеснение из кэша их не стёрло."""
+    trending.checkpoint()
+
+
+@job('posts.touch_author_posts')
+def touch_author_posts(payload):
+    """Обновляет версию карточек всех постов автора."""
+    Post.objects.filter(author_id=payload['author_id']).update(
+        updated=timezone.now())
+    front_page.buffer.invalidate()
+
+
+@job('posts.touch_group_posts')
+def touch_group_posts(payload):
+    """Обновляет версию карточек всех постов группы."""
+    Post.objects.filter(group_id=payload['group_id']).update(
+        updated=timezone.now())
+    front_page.buffer.invalidate()
@@ -0,0 +1,29 @@
+from django import template
+
+from posts import cached, reactions
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.filter
+def with_cards(posts, loader=None):
+    """Пары (пост, карточка) из кэша; недостающие карточки рисуются.
+
+    Счётчики реакций всех постов подгружаются одним запросом, а
+    авторы и группы страницы заранее кладутся в кэш для переходов
+    в их профили и ленты. С загрузчиком запроса (page_obj|with_cards:
+    loader) подписки и реакции запоминаются до конца запроса. Флаг
+    post.is_followed_by_me берётся из кэшированного списка подписок
+    пользователя запроса — без запросов на каждый пост.
+    """
+    posts = list(posts)
+    cached.prime_posts(posts)
+    if loader is None:
+        return render_cards(reactions.attach(posts))
+    author_ids = {post.author_id for post in posts}
+    following = loader.load_many('following', author_ids)
+    for post in posts:
+        post.is_followed_by_me = following[post.author_id]
+    totals = loader.load_many('reactions', [post.pk for post in posts])
+    return render_cards(reactions.attach(posts, totals))
@@ -11,6 +11,8 @@ from posts.models import Comment, Group, Post
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Имя загруженной картинки после раскладки по каталогам.
+SHARDED = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/%s\.gif$'
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -98,7 +100,8 @@ class TaskURLTests(TestCase):
         post_2 = Post.objects.get(id=Post.objects.count())
         self.assertEqual(post_2.text, 'Тестовый заголовок')
         self.assertEqual(post_2.group, self.group)
-        self.assertEqual(post_2.image, 'posts/small.gif')
+        self.assertRegex(
+            post_2.image.name, SHARDED % 'small')
 
     def test_authorized_edit_post(self):
         """Авторизованный может редактировать."""
@@ -131,7 +134,8 @@ class TaskURLTests(TestCase):
         post_2 = Post.objects.get(id=self.post.id)
         self.assertEqual(post_2.text, 'Измененный текст')
         self.assertEqual(post_2.group, self.group2)
-        self.assertEqual(post_2.image, 'posts/small3.gif')
+        self.assertRegex(
+            post_2.image.name, SHARDED % 'small3')
 
     def test_authorized_comment(self):
         """Авторизованный может коментить."""
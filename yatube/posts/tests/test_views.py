@@ -1,18 +1,48 @@
+import os
+import re
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import Http404
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile
 
+from core import cache as cache_utils
+from core import deletion, jobs, storage
+from core.loader import Loader
+from core.models import DeletionTask, Job
+from posts import (cached, cards, follow_feed, follow_graph, front_page,
+                   reactions, recommendations, revisions, trending,
+                   viewcounts)
 from posts.forms import PostForm
-from posts.models import Comment, Follow, Group, Post
+from posts.management.commands import gc_media, shard_media
+from posts.models import (Comment, Follow, Group, Post, PostRevision,
+                          Reaction, ReactionCounter, Recommendation,
+                          TrendingScore)
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Имя загруженной картинки после раскладки по каталогам.
+SHARDED = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/%s\.gif$'
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -63,6 +93,7 @@ class TaskURLTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем авторизованый клиент
@@ -105,7 +136,8 @@ class TaskURLTests(TestCase):
         self.assertEqual(post_group_0, self.group.title)
         self.assertEqual(response.context[
             "title"], 'Последние обновления на сайте')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertRegex(
+            post_image_0.name, SHARDED % 'small')
 
     def test_group_list_page_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -119,7 +151,8 @@ class TaskURLTests(TestCase):
         self.assertEqual(len(response.context.get('page_obj').object_list), 1)
         self.assertEqual(response.context[
             "title"], f'Записи сообщества {self.group}')
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(
+            Post.objects.first().image.name, SHARDED % 'small')
 
     def test_create_post_page_show_correct_context(self):
         """Шаблон create_post сформирован с правильным контекстом."""
@@ -135,7 +168,8 @@ class TaskURLTests(TestCase):
         self.assertEqual(response.context.get('posts').text, 'Тестовая пост')
         self.assertEqual(response.context[
             "posts_count"], self.post.author.posts.count())
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(
+            Post.objects.first().image.name, SHARDED % 'small')
 
     def test_profile_page_show_correct_context(self):
         """Шаблон profile сформирован с правильным контекстом."""
@@ -145,7 +179,8 @@ class TaskURLTests(TestCase):
         self.assertEqual(response.context["author"], self.user)
         self.assertEqual(response.context[
             "posts_count"], self.post.author.posts.count())
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(
+            Post.objects.first().image.name, SHARDED % 'small')
 
     def test_post_edit_show_correct_context(self):
         """Шаблон post_edit сформирован с правильным контекстом."""
@@ -182,6 +217,24 @@ class TaskURLTests(TestCase):
                 'username': self.user2.username}))
         self.assertEqual(Follow.objects.all().count(), 0)
 
+    def test_follow_graph_follows_signals(self):
+        """Граф подписок обновляется при подписке и отписке."""
+        self.assertFalse(
+            follow_graph.is_following(self.user.id, self.user2.id))
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user2.username}))
+        self.assertTrue(
+            follow_graph.is_following(self.user.id, self.user2.id))
+        self.assertEqual(follow_graph.followers_count(self.user2.id), 1)
+        with self.assertNumQueries(0):
+            follow_graph.is_following(self.user.id, self.user2.id)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={
+                'username': self.user2.username}))
+        self.assertFalse(
+            follow_graph.is_following(self.user.id, self.user2.id))
+        self.assertEqual(follow_graph.followers_count(self.user2.id), 0)
+
     def test_subscription_feed(self):
         """Запись появляется в ленте подписчиков."""
         self.authorized_client_folow.get(reverse(
@@ -255,6 +308,7 @@ class CacheTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем авторизованый клиент
@@ -274,3 +328,1211 @@ class CacheTests(TestCase):
         cache.clear()
         response3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response3.content)
+
+    def test_stale_value_while_rebuilding(self):
+        """Пока ключ пересчитывает другой процесс, отдаётся старое."""
+        cache.set('hot', ('старое', 0.1, 0), 60)
+        cache.add(cache_utils.LOCK_KEY.format('hot'), 1)
+        value = cache_utils.get_or_set('hot', lambda: 'новое', 20)
+        self.assertEqual(value, 'старое')
+        cache.delete(cache_utils.LOCK_KEY.format('hot'))
+        value = cache_utils.get_or_set('hot', lambda: 'новое', 20)
+        self.assertEqual(value, 'новое')
+        self.assertEqual(
+            cache_utils.get_or_set('hot', lambda: 'ещё новее', 20), 'новое')
+
+    def test_foreign_lock_kept(self):
+        """Долгий пересчёт не снимает блокировку, взятую другим."""
+        lock = cache_utils.LOCK_KEY.format('slow')
+
+        def compute():
+            # Наша блокировка истекла, и ключ захватил другой процесс.
+            cache.set(lock, 'чужой токен')
+            return 'значение'
+
+        cache_utils.get_or_set('slow', compute, 20)
+        self.assertEqual(cache.get(lock), 'чужой токен')
+
+    @override_settings(CACHE_REFRESH_WORKERS=0)
+    def test_stale_while_revalidate(self):
+        """Устаревшее значение отдаётся сразу, обновление идёт следом."""
+        before = cache_utils.stats()
+        cache.set('feed', ('старое', 0.1, 0), 60)
+        value = cache_utils.get_or_set(
+            'feed', lambda: 'новое', 20, stale_while_revalidate=True)
+        self.assertEqual(value, 'старое')
+        self.assertEqual(cache.get('feed')[0], 'новое')
+        after = cache_utils.stats()
+        self.assertEqual(after['stale_hits'], before['stale_hits'] + 1)
+        self.assertEqual(after['refreshes'], before['refreshes'] + 1)
+
+    @override_settings(CACHE_REFRESH_WORKERS=0)
+    def test_index_fragment_refreshed_after_expiry(self):
+        """Истёкший фрагмент ленты перерисовывается после ответа."""
+        key = make_template_fragment_key('index_page', [1])
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        value, delta, expires = cache.get(key)
+        cache.set(key, (value, delta, 0), 60)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertIn('Свежий пост', cache.get(key)[0])
+
+    def test_posts_count_invalidated(self):
+        """Счётчик постов сбрасывается при новом посте."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        self.assertEqual(self.guest_client.get(url).context['posts_count'], 0)
+        Post.objects.create(author=self.user, text='Тестовая пост')
+        self.assertEqual(self.guest_client.get(url).context['posts_count'], 1)
+
+    def test_cache_stats_for_staff(self):
+        """Статистика кэша доступна только персоналу."""
+        url = reverse('cache_stats')
+        self.assertEqual(self.authorized_client.get(url).status_code, 302)
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.authorized_client.force_login(admin)
+        self.assertIn('hit_ratio', self.authorized_client.get(url).json())
+
+    def test_index_pages_cached_separately(self):
+        """Фрагмент ленты кэшируется для каждой страницы отдельно."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}') for i in range(11))
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first.content, second.content)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.friend = User.objects.create_user(username='friend')
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.friend, author=cls.author)
+        Follow.objects.create(user=cls.friend, author=cls.other)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Post.objects.create(
+            author=cls.reader, text='Пост читателя', group=cls.group)
+        Post.objects.create(
+            author=cls.author, text='Пост автора', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_build_scores_two_hop_authors(self):
+        """Рекомендуются авторы через подписку, общие группы весомее."""
+        recommendations.build()
+        suggested = list(Recommendation.objects.filter(
+            user=self.reader).values_list('author__username', flat=True))
+        self.assertEqual(suggested, ['author', 'other'])
+        self.assertFalse(Recommendation.objects.filter(
+            user=self.reader, author=self.friend).exists())
+
+    def test_follow_page_shows_suggestions(self):
+        """Страница подписок читает готовые рекомендации."""
+        recommendations.build(k=1)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [s.author for s in response.context['suggestions']],
+            [self.author],
+        )
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_scores_decay(self):
+        """Свежий лёгкий вес обгоняет старый тяжёлый."""
+        trending.bump('posts', 1, 3.0, now=0)
+        trending.bump('posts', 2, 1.0, now=trending.HALF_LIFE * 2)
+        self.assertEqual(trending.top_ids('posts'), [2, 1])
+        trending.bump('posts', 1, 1.0, now=trending.HALF_LIFE * 2)
+        self.assertEqual(trending.top_ids('posts'), [1, 2])
+
+    def test_capacity_is_bounded(self):
+        """Таблица не растёт больше CAPACITY."""
+        for pk in range(1, trending.CAPACITY + 11):
+            trending.bump('authors', pk, float(pk), now=0)
+        self.assertEqual(
+            len(trending._table('authors')), trending.CAPACITY)
+        self.assertEqual(trending.top_ids('authors', 1), [
+            trending.CAPACITY + 10])
+
+    def test_comment_and_checkpoint(self):
+        """Комментарии поднимают пост, таблицы переживают сброс кэша."""
+        quiet = Post.objects.create(author=self.user, text='Тихий пост')
+        loud = Post.objects.create(
+            author=self.user, text='Громкий пост', group=self.group)
+        Comment.objects.create(author=self.user, post=loud, text='Ещё')
+        jobs.run_pending()
+        self.assertEqual(trending.top_ids('posts'), [loud.id, quiet.id])
+        trending.checkpoint()
+        self.assertEqual(
+            TrendingScore.objects.filter(kind='posts').count(), 2)
+        cache.clear()
+        self.assertEqual(trending.top_ids('posts'), [loud.id, quiet.id])
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['trending_groups']), [
+            self.group])
+        self.assertContains(response, 'Сейчас популярно')
+
+    def test_checkpoint_scheduled(self):
+        """После событий сохранение таблиц ставится в очередь один раз."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        jobs.run_pending()
+        Comment.objects.create(author=self.user, post=post, text='Ответ')
+        jobs.run_pending()
+        checkpoints = Job.objects.filter(name='posts.checkpoint_trending')
+        self.assertEqual(checkpoints.count(), 1)
+        self.assertFalse(TrendingScore.objects.exists())
+        checkpoints.update(run_after=timezone.now())
+        jobs.run_pending()
+        cache.clear()
+        self.assertEqual(trending.top_ids('posts'), [post.id])
+
+    def test_locked_table_is_retried(self):
+        """Пока таблицы заняты, события ждут в очереди, а не теряются."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        token = cache_utils.acquire(trending.LOCK_KEY)
+        with mock.patch.object(trending, 'LOCK_WAIT', 0):
+            jobs.run_pending()
+        self.assertEqual(trending.top_ids('posts'), [])
+        cache_utils.release(trending.LOCK_KEY, token)
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        self.assertEqual(trending.top_ids('posts'), [post.id])
+
+
+class CardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Иван', last_name='Иванов')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовая пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def profile(self):
+        return self.guest_client.get(reverse(
+            'posts:profile', kwargs={'username': self.user.username}))
+
+    def test_feed_stores_cards(self):
+        """Лента сохраняет карточки и берёт их из кэша."""
+        self.profile()
+        key = cards.card_key(self.post)
+        cache.set(key, 'из кэша')
+        self.assertContains(self.profile(), 'из кэша')
+
+    def test_edit_changes_card(self):
+        """Правка поста меняет ключ карточки."""
+        old_key = cards.card_key(self.post)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Новый текст', 'group': self.group.id},
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertNotEqual(cards.card_key(post), old_key)
+        self.assertContains(self.profile(), 'Новый текст')
+
+    def test_author_rename_changes_card(self):
+        """Смена имени автора обновляет его карточки."""
+        self.profile()
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Пётр'
+        user.save()
+        self.assertNotContains(self.profile(), 'Автор: Пётр Иванов')
+        jobs.run_pending()
+        self.assertContains(self.profile(), 'Автор: Пётр Иванов')
+        post = Post.objects.get(pk=self.post.pk)
+        user.save(update_fields=['last_login'])
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).updated, post.updated)
+
+    def test_group_change_changes_card(self):
+        """Изменение группы обновляет карточки её постов."""
+        self.profile()
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new_slug'
+        group.save()
+        jobs.run_pending()
+        self.assertContains(self.profile(), '/group/new_slug/')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShardedMediaTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+
+    def legacy_post(self, name):
+        """Пост с картинкой, сохранённой по старой плоской схеме."""
+        name = self.storage.save(f'posts/{name}', ContentFile(b'gif'))
+        return Post.objects.create(author=self.user, text='Тест', image=name)
+
+    def test_upload_is_sharded(self):
+        """Новые картинки попадают в каталоги-шарды."""
+        post = Post.objects.create(author=self.user, text='Тест')
+        post.image.save('small.gif', ContentFile(b'gif'))
+        self.assertRegex(post.image.name, SHARDED % 'small')
+        self.assertTrue(self.storage.exists(post.image.name))
+
+    def test_shard_media_moves_files(self):
+        """shard_media переносит файлы и переписывает пути."""
+        post = self.legacy_post('old.gif')
+        old_path = self.storage.path(post.image.name)
+        call_command('shard_media', batch=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertRegex(post.image.name, SHARDED % 'old')
+        self.assertTrue(self.storage.exists(post.image.name))
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_shard_media_resumes(self):
+        """Повторный запуск доводит до конца прерванный перенос."""
+        post = self.legacy_post('half.gif')
+        # Файл перенесён, но запись в базе не обновлена.
+        target = storage.shard_name(post.image.name)
+        os.makedirs(os.path.dirname(self.storage.path(target)))
+        os.replace(
+            self.storage.path(post.image.name), self.storage.path(target))
+        call_command('shard_media', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, target)
+
+    def test_shard_media_keeps_clashing_upload(self):
+        """Чужой файл на месте шарда не затирается."""
+        post = self.legacy_post('image.gif')
+        target = storage.shard_name(post.image.name)
+        self.storage.save(target, ContentFile(b'new'))
+        other = Post.objects.create(
+            author=self.user, text='Новый', image=target)
+        call_command('shard_media', stdout=StringIO())
+        post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertNotEqual(post.image.name, target)
+        self.assertTrue(storage.is_sharded(post.image.name))
+        with self.storage.open(post.image.name) as f:
+            self.assertEqual(f.read(), b'gif')
+        with self.storage.open(other.image.name) as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertFalse(self.storage.exists('posts/image.gif'))
+
+    def test_shard_media_keeps_replaced_upload(self):
+        """Картинка, заменённая во время переноса, не затирается."""
+        post = self.legacy_post('replaced.gif')
+
+        def replacing_now():
+            # Файл уже перенесён, запись в базу ещё не сделана.
+            Post.objects.filter(pk=post.pk).update(image='posts/new.gif')
+            return timezone.now()
+
+        clock = mock.Mock(now=replacing_now)
+        with mock.patch.object(shard_media, 'timezone', clock):
+            call_command('shard_media', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/new.gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGCTests(TestCase):
+    SMALL_GIF = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+        self.post = Post.objects.create(author=user, text='Тест')
+        self.post.image.save('kept.gif', ContentFile(self.SMALL_GIF))
+        self.orphan = self.storage.save(
+            'posts/lost.gif', ContentFile(self.SMALL_GIF))
+
+    def gc(self, **options):
+        out = StringIO()
+        call_command('gc_media', min_age=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_lists_orphans(self):
+        """Пробный запуск только перечисляет сирот."""
+        output = self.gc(dry_run=True)
+        self.assertIn(self.orphan, output)
+        self.assertNotIn(self.post.image.name, output)
+        self.assertTrue(self.storage.exists(self.orphan))
+
+    def test_deletes_orphans_and_thumbnails(self):
+        """Удаляются сироты и их миниатюры, живые файлы остаются."""
+        thumbnail = get_thumbnail(
+            ImageFile(self.orphan, self.storage), '2x1').name
+        self.assertTrue(self.storage.exists(thumbnail))
+        self.gc(workers=2, batch=1)
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(self.storage.exists(thumbnail))
+        self.assertTrue(self.storage.exists(self.post.image.name))
+
+    def test_young_files_are_kept(self):
+        """Свежие файлы не удаляются: пост мог ещё не сохраниться."""
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(self.storage.exists(self.orphan))
+
+    def test_unordered_names_stop_before_deleting(self):
+        """При не побайтовой сортировке ни один файл не удаляется."""
+        names = ['posts/', 'posts']
+        with mock.patch.object(
+                gc_media, 'referenced_names',
+                lambda size: gc_media.ordered(iter(names))):
+            with self.assertRaises(CommandError):
+                self.gc()
+        self.assertTrue(self.storage.exists(self.orphan))
+
+    def test_vanished_file_skipped(self):
+        """Файл, пропавший во время обхода, пропускается."""
+        self.assertFalse(gc_media.is_old(
+            self.storage.path('posts/gone.gif'), time.time()))
+
+
+@mock.patch.object(deletion, 'BATCH_SIZE', 2)
+class BackgroundDeletionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}', group=self.group)
+            for i in range(5)
+        ]
+        for post in self.posts:
+            Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.user)
+        jobs.run_pending()
+
+    def test_user_hidden_then_deleted(self):
+        """Пользователь скрывается сразу, каскад удаляется пачками."""
+        task = deletion.schedule(self.user)
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Post.visible.exists())
+        # Админка и связи по-прежнему видят скрытые посты.
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(self.user.posts.count(), 5)
+        # Своих комментариев у автора нет: первый шаг пуст,
+        # второй удаляет первую пачку комментариев к его постам.
+        jobs.run(jobs.claim())
+        jobs.run(jobs.claim())
+        task.refresh_from_db()
+        self.assertEqual((task.step, task.processed), (1, 2))
+        self.assertEqual(Comment.objects.count(), 3)
+        jobs.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.DONE)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_resume_after_lost_job(self):
+        """resume продолжает удаление, если задача пропала из очереди."""
+        task = deletion.schedule(self.posts[0])
+        Job.objects.all().delete()
+        self.assertEqual(deletion.resume(), 1)
+        jobs.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.DONE)
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertEqual(Comment.objects.count(), 4)
+
+    def test_group_posts_nullified(self):
+        """Посты удалённой группы остаются без группы."""
+        deletion.schedule(self.group)
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}))
+        self.assertEqual(response.status_code, 404)
+        jobs.run_pending()
+        self.assertFalse(Group.objects.exists())
+        self.assertEqual(Post.objects.filter(group=None).count(), 5)
+
+
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        # Цепочка ответов глубиной 5 и ещё один корень.
+        self.chain = []
+        parent = None
+        for depth in range(5):
+            parent = Comment.objects.create(
+                post=self.post, author=self.user,
+                text=f'Уровень {depth}', parent=parent)
+            self.chain.append(parent)
+        self.other = Comment.objects.create(
+            post=self.post, author=self.user, text='Другой корень')
+
+    def test_paths_and_counts(self):
+        """Путь, глубина и число ответов считаются при создании."""
+        root = Comment.objects.get(pk=self.chain[0].pk)
+        leaf = Comment.objects.get(pk=self.chain[-1].pk)
+        self.assertEqual(root.descendants, 4)
+        self.assertEqual(leaf.depth, 4)
+        self.assertEqual(
+            leaf.ancestor_ids(), [comment.pk for comment in self.chain[:-1]])
+        with self.assertNumQueries(1):
+            thread = list(Comment.objects.thread(self.post))
+        # Новые ветки сверху, внутри ветки — обход дерева.
+        self.assertEqual(thread, [self.other] + self.chain)
+
+    def test_post_detail_collapses_deep_replies(self):
+        """Глубокие ответы подгружаются по ссылке на поддерево."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        shown = response.context['comments']
+        self.assertEqual(len(shown), 4)
+        self.assertTrue(shown[3].collapsed)
+        self.assertContains(response, 'Показать ответы (2)')
+        response = self.client.get(reverse(
+            'posts:comment_thread',
+            kwargs={'post_id': self.post.id, 'comment_id': self.chain[2].pk},
+        ))
+        self.assertEqual(
+            [comment.pk for comment in response.context['comments']],
+            [comment.pk for comment in self.chain[2:]],
+        )
+
+    def test_reply(self):
+        """Ответ через форму попадает в поддерево родителя."""
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Ответ', 'parent': self.other.pk},
+        )
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual(reply.parent, self.other)
+        self.assertEqual(reply.depth, 1)
+        self.assertEqual(
+            Comment.objects.get(pk=self.other.pk).descendants, 1)
+
+    def test_delete_updates_counts(self):
+        """Удаление поддерева уменьшает счётчики предков."""
+        Comment.objects.filter(pk=self.chain[3].pk).delete()
+        root = Comment.objects.get(pk=self.chain[0].pk)
+        self.assertEqual(root.descendants, 2)
+        self.assertFalse(Comment.objects.filter(pk=self.chain[4].pk).exists())
+
+    def test_instance_and_cascade_delete_update_counts(self):
+        """Счётчики верны и при удалении объекта, и каскадом."""
+        Comment.objects.get(pk=self.chain[3].pk).delete()
+        self.assertEqual(
+            Comment.objects.get(pk=self.chain[0].pk).descendants, 2)
+        guest = User.objects.create_user(username='guest')
+        Comment.objects.create(
+            post=self.post, author=guest, text='Ответ', parent=self.other)
+        self.assertEqual(
+            Comment.objects.get(pk=self.other.pk).descendants, 1)
+        guest.delete()
+        self.assertEqual(
+            Comment.objects.get(pk=self.other.pk).descendants, 0)
+
+
+# Приращения учитываются в on_commit, нужны настоящие транзакции.
+class ReactionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        reactions.buffer.flush()
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Пост')
+
+    def react(self, kind):
+        return self.client.post(
+            reverse('posts:post_react', kwargs={'post_id': self.post.id}),
+            data={'kind': kind},
+        )
+
+    def totals(self):
+        return dict(reactions.counts([self.post.pk])[self.post.pk])
+
+    def test_toggle(self):
+        """Реакция ставится, меняется и снимается повторным нажатием."""
+        self.react(Reaction.LIKE)
+        self.assertEqual(self.totals(), {Reaction.LIKE: 1})
+        self.react(Reaction.HEART)
+        self.assertEqual(Reaction.objects.get().kind, Reaction.HEART)
+        self.assertEqual(
+            self.totals(), {Reaction.LIKE: 0, Reaction.HEART: 1})
+        self.react(Reaction.HEART)
+        self.assertFalse(Reaction.objects.exists())
+        self.assertEqual(self.totals().get(Reaction.HEART), 0)
+
+    def test_shards_are_merged(self):
+        """Сброшенные в разные шарды приращения складываются."""
+        users = [
+            User.objects.create_user(username=f'user{i}') for i in range(3)
+        ]
+        for shard, user in enumerate(users):
+            reactions.toggle(user, self.post, Reaction.LIKE)
+            with mock.patch('random.randrange', return_value=shard):
+                reactions.buffer.flush()
+        self.assertEqual(ReactionCounter.objects.count(), 3)
+        self.assertEqual(self.totals(), {Reaction.LIKE: 3})
+
+    def test_feed_counts_in_one_query(self):
+        """Счётчики ленты приходят одним запросом на страницу."""
+        posts = [self.post] + [
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        for post in posts:
+            reactions.toggle(self.user, post, Reaction.LAUGH)
+        reactions.buffer.flush()
+        with self.assertNumQueries(1):
+            reactions.attach(posts)
+        self.assertEqual(
+            posts[0].reaction_counts, [(Reaction.LAUGH, '😄', 1)])
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertContains(response, '😄 1', count=4)
+
+
+class ViewCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        viewcounts.buffer.flush()
+        viewcounts.recent._seen.clear()
+        user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=user, text='Пост')
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id})
+        self.client.force_login(user)
+
+    def test_session_views_counted_once(self):
+        """Повторный просмотр в той же сессии не засчитывается."""
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['views'], 1)
+        Client().get(self.url)
+        self.assertEqual(viewcounts.buffer.get(self.post.pk), 2)
+
+    def test_flush_writes_views(self):
+        """Накопленные просмотры записываются одним обновлением."""
+        other = Post.objects.create(author=self.post.author, text='Ещё')
+        for post, views in ((self.post, 3), (other, 1)):
+            for _ in range(views):
+                viewcounts.buffer.add(post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            viewcounts.buffer.flush()
+        updates = [
+            query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).views, 3)
+        self.assertEqual(Post.objects.get(pk=other.pk).views, 1)
+        self.assertEqual(viewcounts.buffer.pending(), {})
+
+    def test_save_keeps_flushed_views(self):
+        """Правка поста не затирает просмотры, сброшенные после загрузки."""
+        post = Post.objects.get(pk=self.post.pk)
+        viewcounts.buffer.add(post.pk, 2)
+        viewcounts.buffer.flush()
+        post.text = 'Исправленный пост'
+        post.save()
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Ещё раз исправленный'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.text, post.views), ('Ещё раз исправленный', 2))
+
+
+class EntityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+
+    def test_user_lookup_cached(self):
+        """Повторный поиск автора не обращается к базе."""
+        cached.user_or_404('auth')
+        with self.assertNumQueries(0):
+            self.assertEqual(cached.user_or_404('auth'), self.user)
+
+    def test_missing_user_cached_until_created(self):
+        """Отсутствие кэшируется и сбрасывается при создании."""
+        with self.assertRaises(Http404):
+            cached.user_or_404('newbie')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            cached.user_or_404('newbie')
+        User.objects.create_user(username='newbie')
+        self.assertEqual(cached.user_or_404('newbie').username, 'newbie')
+
+    def test_renames_drop_old_keys(self):
+        """После переименования старые username и slug не находятся."""
+        cached.user_or_404('auth')
+        cached.group_or_404('test_slug')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.group.slug = 'new_slug'
+        self.group.save()
+        with self.assertRaises(Http404):
+            cached.user_or_404('auth')
+        with self.assertRaises(Http404):
+            cached.group_or_404('test_slug')
+        self.assertEqual(cached.user_or_404('renamed'), self.user)
+        self.assertEqual(cached.group_or_404('new_slug'), self.group)
+
+    def test_feed_primes_authors_and_groups(self):
+        """Лента заранее кладёт в кэш своих авторов и группы."""
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        # Главная собирается из буфера и кэш не заполняет.
+        self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}))
+        with self.assertNumQueries(0):
+            cached.user_or_404('auth')
+            cached.group_or_404('test_slug')
+
+    def test_cached_user_has_no_password(self):
+        """Автор хранится в кэше без хеша пароля."""
+        cached.user_or_404('auth')
+        data = cache.get(cached.USER_KEY.format('auth'))[0]
+        self.assertNotIn('password', data)
+
+    def test_prime_skips_inactive_authors(self):
+        """Заблокированный автор не попадает в кэш через ленту."""
+        post = Post(author=self.user, text='Пост')
+        self.user.is_active = False
+        cached.prime_posts([post])
+        self.assertIsNone(cache.get(cached.USER_KEY.format('auth')))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        self.old = Post.objects.create(
+            author=self.user, text='Старый пост', group=self.group)
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        self.new = Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        call_command('archive_posts', days=365, batch=1, stdout=StringIO())
+
+    def test_archived_only_in_cold_lookups(self):
+        """Архивный пост виден в профиле и по ссылке, но не в лентах."""
+        self.assertTrue(Post.objects.get(pk=self.old.pk).archived)
+        self.assertFalse(Post.objects.get(pk=self.new.pk).archived)
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=['test_slug'])):
+            response = self.client.get(url)
+            self.assertEqual(
+                list(response.context['page_obj']), [self.new], url)
+        response = self.client.get(
+            reverse('posts:profile', args=['auth']))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.new, self.old])
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.old.pk]))
+        self.assertContains(response, 'Старый пост')
+
+
+class RevisionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(
+            author=self.user, text='первая версия текста поста')
+
+    def edit(self, text):
+        self.client.post(
+            reverse('posts:post_edit', args=[self.post.pk]), {'text': text})
+
+    def test_every_version_restored(self):
+        """Любая версия собирается из снимка и дельт после него."""
+        texts = ['первая версия текста поста']
+        for number in range(1, 13):
+            texts.append(f'версия  {number} текста\nпоста')
+            self.edit(texts[-1])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, texts[-1])
+        self.assertEqual(
+            list(PostRevision.objects.filter(
+                post=self.post, snapshot=True).values_list(
+                    'number', flat=True)),
+            [0, 10])
+        for number, text in enumerate(texts):
+            with self.assertNumQueries(1):
+                self.assertEqual(
+                    revisions.text_at(self.post, number), text)
+        self.assertIsNone(revisions.text_at(self.post, 13))
+        self.assertEqual(
+            [text for _, text in revisions.history(self.post)], texts)
+
+    def test_delta_is_compact(self):
+        """Дельта небольшой правки много меньше текста."""
+        long_text = ' '.join(f'слово{i}' for i in range(500))
+        self.edit(long_text)
+        self.edit(long_text.replace('слово250', 'правка'))
+        delta = PostRevision.objects.get(post=self.post, number=2)
+        self.assertFalse(delta.snapshot)
+        self.assertLess(len(delta.data), len(long_text.encode()) // 20)
+
+    def test_unchanged_text_not_recorded(self):
+        self.edit('первая версия текста поста')
+        Post.objects.filter(pk=self.post.pk).update(views=1)
+        self.post.save(update_fields=['group'])
+        self.assertFalse(PostRevision.objects.exists())
+
+
+class DataLoaderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(3)
+        ]
+        for author in self.authors:
+            Post.objects.create(author=author, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.ids = [author.pk for author in self.authors]
+
+    def test_page_data_batched_and_memoized(self):
+        """Каждый вид данных — один запрос на страницу, затем память."""
+        loader = Loader()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                loader.load_many('posts_count', self.ids),
+                dict.fromkeys(self.ids, 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(loader.load_many('followers_count', self.ids).values()),
+                [1, 0, 0])
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.load('followers_count', self.ids[0]), 1)
+        with self.assertNumQueries(0):
+            loader.load_many('posts_count', self.ids)
+            self.assertEqual(
+                Loader().load_many('posts_count', self.ids),
+                dict.fromkeys(self.ids, 1))
+
+    @override_settings(CACHE_REFRESH_WORKERS=0)
+    def test_expired_counts_served_stale(self):
+        """Истёкший счётчик отдаётся сразу и обновляется следом."""
+        pk = self.ids[0]
+        key = cached.POSTS_COUNT_KEY.format(pk)
+        cache.set(key, (7, 0.0, 0), 60)
+        self.assertEqual(cached.posts_counts([pk]), {pk: 7})
+        self.assertEqual(cache.get(key)[0], 1)
+
+    def test_following_for_request_user(self):
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(
+            reverse('posts:profile', args=['author0']))
+        loader = response.context['loader']
+        self.assertTrue(response.context['following'])
+        self.assertEqual(
+            loader.load_many('following', self.ids),
+            {self.ids[0]: True, self.ids[1]: False, self.ids[2]: False})
+        self.assertEqual(response.context['followers_count'], 1)
+
+
+class FeedFollowButtonTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        self.followed = User.objects.create_user(username='followed')
+        self.other = User.objects.create_user(username='other')
+        for author in (self.followed, self.other, self.reader):
+            Post.objects.create(author=author, text='Текст', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.followed)
+        self.client.force_login(self.reader)
+
+    def test_flags_and_buttons(self):
+        """Кнопки подписки у чужих постов по флагу is_followed_by_me."""
+        response = self.client.get(
+            reverse('posts:group_list', args=['test_slug']))
+        flags = {
+            post.author.username: post.is_followed_by_me
+            for post in response.context['page_obj']
+        }
+        self.assertEqual(
+            flags, {'followed': True, 'other': False, 'reader': False})
+        self.assertContains(
+            response, reverse('posts:profile_unfollow', args=['followed']))
+        self.assertContains(
+            response, reverse('posts:profile_follow', args=['other']))
+        self.assertNotContains(
+            response, reverse('posts:profile_follow', args=['reader']))
+
+    def test_index_fragment_shared(self):
+        """Фрагмент главной общий, подписки читателя идут отдельно."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['follow_marks'], {
+            'me': self.reader.pk, 'following': [self.followed.pk]})
+        self.assertContains(response, 'id="follow-marks"')
+        self.assertContains(response, 'data-author-id', count=3)
+        self.assertIsNotNone(
+            cache.get(make_template_fragment_key('index_page', [1])))
+        guest = Client().get(reverse('posts:index'))
+        self.assertIsNone(guest.context['follow_marks'])
+        self.assertNotContains(guest, 'id="follow-marks"')
+        self.assertContains(guest, 'data-author-id', count=3)
+
+    def test_no_queries_per_post(self):
+        url = reverse('posts:group_list', args=['test_slug'])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(5):
+            author = User.objects.create_user(username=f'new{i}')
+            Post.objects.create(author=author, text='Текст', group=self.group)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+
+    def test_cached_index_follows_subscription(self):
+        """Кэш ленты не показывает старое состояние подписки."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        Follow.objects.create(user=self.reader, author=self.other)
+        self.assertEqual(
+            self.client.get(url).context['follow_marks']['following'],
+            sorted([self.followed.pk, self.other.pk]))
+
+
+@override_settings(FOLLOW_FEED_ENGINE='merge')
+class MergeFollowFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(4)
+        ]
+        stranger = User.objects.create_user(username='stranger')
+        now = timezone.now()
+        for i in range(25):
+            author = self.authors[i % 4] if i % 5 else stranger
+            post = Post.objects.create(author=author, text=f'Пост {i}')
+            # Одинаковое время у пар постов: порядок решает id.
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - timedelta(minutes=(i * 7) % 13))
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+        self.client.force_login(self.reader)
+        self.expected = list(Post.objects.filter(
+            author__in=self.authors).order_by('-pub_date', '-pk'))
+
+    def walk(self):
+        url = reverse('posts:follow_index')
+        posts, cursor = [], ''
+        while True:
+            page_obj = self.client.get(
+                url, {'cursor': cursor}).context['page_obj']
+            posts.extend(page_obj)
+            if not page_obj.has_next():
+                return posts
+            cursor = page_obj.next_cursor
+
+    def test_same_order_as_sql(self):
+        """Слияние потоков даёт тот же порядок, что и запрос."""
+        self.assertEqual(self.walk(), self.expected)
+        with mock.patch.object(follow_feed, 'STREAM_LENGTH', 3):
+            cache.clear()
+            self.assertEqual(self.walk(), self.expected)
+
+    def test_warm_page_is_one_query(self):
+        author_ids = [author.pk for author in self.authors]
+        follow_feed.page(author_ids, None, 10)
+        with self.assertNumQueries(1):
+            page_obj = follow_feed.page(author_ids, None, 10)
+        self.assertEqual(list(page_obj), self.expected[:10])
+
+    def test_cold_page_loads_streams_in_one_query(self):
+        """Промахи потоков всех авторов — один запрос."""
+        author_ids = [author.pk for author in self.authors]
+        with self.assertNumQueries(2):
+            page_obj = follow_feed.page(author_ids, None, 10)
+        self.assertEqual(list(page_obj), self.expected[:10])
+
+    def test_streams_limited_in_database(self):
+        """База отдаёт не больше STREAM_LENGTH постов автора."""
+        author_ids = [author.pk for author in self.authors]
+        with mock.patch.object(follow_feed, 'STREAM_LENGTH', 3):
+            loaded = follow_feed.load_streams(author_ids)
+        for author in self.authors:
+            expected = [
+                follow_feed.position(post.pub_date, post.pk)
+                for post in self.expected if post.author == author
+            ]
+            self.assertEqual(loaded[author.pk], expected[:3])
+
+    def test_stream_refreshed_on_reactivation(self):
+        """Разблокированный автор возвращается в ленту подписок."""
+        author = self.authors[0]
+        author.is_active = False
+        author.save()
+        self.assertNotIn(author, [post.author for post in self.walk()])
+        author.is_active = True
+        author.save()
+        self.assertEqual(self.walk(), self.expected)
+
+    def test_stream_invalidated_on_new_post(self):
+        self.walk()
+        post = Post.objects.create(author=self.authors[0], text='Свежий')
+        self.assertEqual(self.walk()[0], post)
+        post.delete()
+        self.assertEqual(self.walk(), self.expected)
+
+    def test_benchmark_leaves_no_data(self):
+        users, posts = User.objects.count(), Post.objects.count()
+        out = StringIO()
+        call_command(
+            'bench_follow_feed', authors=3, posts=4, long_authors=1,
+            long_posts=120, pages=2, repeat=1, stdout=out)
+        self.assertIn('merge: страница 2', out.getvalue())
+        self.assertEqual(User.objects.count(), users)
+        self.assertEqual(Post.objects.count(), posts)
+
+
+class FrontPageBufferTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        for i in range(7):
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}', group=self.group)
+        # Два процесса с общим кэшем; сигналы приходят в первый.
+        self.worker = front_page.FrontPage(5)
+        self.other = front_page.FrontPage(5)
+        patcher = mock.patch.object(front_page, 'buffer', self.worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queryset = Post.visible.hot().select_related('group', 'author')
+
+    def page(self, buffer, number):
+        posts = front_page.BufferedPosts(buffer, self.queryset.all())
+        return list(Paginator(posts, 2).get_page(number))
+
+    def test_pages_inside_buffer_without_queries(self):
+        """Страницы в пределах буфера собираются без запросов."""
+        expected = list(self.queryset)
+        self.assertEqual(self.page(self.worker, 1), expected[:2])
+        with self.assertNumQueries(0):
+            first = self.page(self.worker, 2)
+        self.assertEqual(first, expected[2:4])
+        self.assertEqual(first[0].author.get_full_name(), 'Лев Толстой')
+        self.assertEqual(first[0].group.slug, 'test_slug')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.page(self.worker, 3), expected[4:6])
+        self.assertFalse(hasattr(self.worker._records[0], '__dict__'))
+
+    def test_saved_posts_applied_and_published(self):
+        self.page(self.worker, 1)
+        self.page(self.other, 1)
+        post = Post.objects.create(author=self.user, text='Свежий пост')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.page(self.worker, 1)[0].text, 'Свежий пост')
+        self.assertEqual(self.page(self.other, 1)[0], post)
+        post.text = 'Исправленный пост'
+        post.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.page(self.worker, 1)[0].text, 'Исправленный пост')
+        # Удаление идёт в транзакции: буферы перечитываются.
+        post.delete()
+        self.assertEqual(self.page(self.worker, 1)[0].text, 'Пост 6')
+        self.assertEqual(self.page(self.other, 1)[0].text, 'Пост 6')
+
+    def test_concurrent_writes_not_adopted(self):
+        """Запись другого процесса перед нашей: буфер перечитывается."""
+        self.page(self.worker, 1)
+        self.page(self.other, 1)
+        incr = front_page.cache.incr
+        other_posts = []
+
+        def racing_incr(key, *args, **kwargs):
+            if not other_posts:
+                # Другой процесс успевает сохранить свой пост.
+                post = Post(author=self.user, text='Чужой пост')
+                Post.objects.bulk_create([post])
+                other_posts.append(Post.objects.first())
+                self.other.post_saved(other_posts[0], True)
+            return incr(key, *args, **kwargs)
+
+        with mock.patch.object(front_page.cache, 'incr', racing_incr):
+            Post.objects.create(author=self.user, text='Свой пост')
+        texts = [post.text for post in self.page(self.worker, 1)]
+        self.assertEqual(texts, ['Чужой пост', 'Свой пост'])
+        texts = [post.text for post in self.page(self.other, 1)]
+        self.assertEqual(texts, ['Чужой пост', 'Свой пост'])
+
+    def test_bulk_changes_reload_buffers(self):
+        self.page(self.worker, 1)
+        newest = Post.objects.first()
+        deletion.schedule(newest)
+        self.assertEqual(self.page(self.worker, 1)[0].text, 'Пост 5')
+        Post.objects.update(pub_date=timezone.now() - timedelta(days=400))
+        call_command('archive_posts', stdout=StringIO())
+        self.assertEqual(self.page(self.worker, 1), [])
+
+    def test_index_served_from_buffer(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj']), list(self.queryset))
+        self.assertEqual(response.context['page_obj'].paginator.count, 7)
+
+    def index_from_buffer(self):
+        """Главная, целиком собранная из буфера."""
+        with mock.patch.object(
+                front_page, 'buffer', front_page.FrontPage(10)):
+            self.client.get(reverse('posts:index'))
+
+    def test_buffer_posts_not_primed(self):
+        """Неполные авторы и группы из буфера не попадают в кэш."""
+        self.index_from_buffer()
+        self.assertIsNone(cache.get(cached.USER_KEY.format('auth')))
+        self.assertIsNone(cache.get(cached.GROUP_KEY.format('test_slug')))
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}))
+        self.assertEqual(response.context['group'].description, 'Описание')
+
+    def test_hidden_group_stays_hidden_after_index(self):
+        deletion.schedule(self.group)
+        self.index_from_buffer()
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}))
+        self.assertEqual(response.status_code, 404)
+
+
+def normalized(html):
+    return re.sub(r'>\s+<', '><', re.sub(r'\s+', ' ', html)).strip()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class JinjaFeedParityTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='"Толстой"')
+        self.reader = User.objects.create_user(username='reader')
+        Group.objects.create(
+            title='Группа <b>', slug='test_slug', description='Про "всё"')
+        group = Group.objects.get()
+        image = SimpleUploadedFile(
+            'small.gif', MediaGCTests.SMALL_GIF, content_type='image/gif')
+        Post.objects.create(
+            author=self.author, text='С картинкой', group=group, image=image)
+        for i in range(12):
+            Post.objects.create(
+                author=self.author, text=f'Пост {i} <i>"кавычки"\'</i>',
+                group=group if i % 2 else None)
+        Follow.objects.create(user=self.reader, author=self.author)
+        reactions.buffer.add((Post.objects.first().pk, Reaction.LIKE))
+        self.addCleanup(reactions.buffer.flush)
+
+    def render(self, engine, client, url):
+        cache.clear()
+        with override_settings(FEED_TEMPLATE_ENGINE=engine):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return normalized(response.content.decode())
+
+    def test_feeds_render_the_same(self):
+        """Шаблоны Jinja2 дают тот же HTML, что и Django-шаблоны."""
+        reader = Client()
+        reader.force_login(self.reader)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', args=['test_slug']),
+            reverse('posts:profile', args=['auth']),
+            reverse('posts:follow_index'),
+        ]
+        pages = [(Client(), url) for url in urls[:-1]]
+        pages += [(reader, url) for url in urls]
+        for client, url in pages:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.render('jinja2', client, url),
+                    self.render('django', client, url))
+        self.assertIn(
+            'card-img', self.render('jinja2', reader, urls[1]))
+
+    def test_cards_shared_between_engines(self):
+        post = Post.objects.last()
+        with override_settings(FEED_TEMPLATE_ENGINE='jinja2'):
+            jinja_card = cards.render_card(post)
+        self.assertIn('card-img', jinja_card)
+        self.assertEqual(
+            normalized(jinja_card), normalized(cards.render_card(post)))
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('bench_feed_templates', repeat=1, stdout=out)
+        self.assertIn('jinja2', out.getvalue())
@@ -0,0 +1,129 @@
+"""Трендовые посты, группы и авторы.
+
+Каждое событие (новый пост, комментарий) добавляет вес, который
+затухает с периодом полураспада HALF_LIFE. Чтобы не пересчитывать
+старые значения, счёт хранится в логарифмах относительно нулевого
+момента времени: log(вес) + t * ln2 / HALF_LIFE. Такие значения
+можно сравнивать напрямую, и добавление нового события не трогает
+остальные записи.
+
+Для каждого вида хранится не более CAPACITY записей в кэше; самая
+слабая вытесняется. Таблицы меняются только под блокировкой
+LOCK_KEY, поэтому воркеры runjobs не теряют вклады друг друга.
+Задача posts.checkpoint_trending (её ставит обработка событий, не
+чаще раза в CHECKPOINT_INTERVAL) и команда checkpoint_trending
+сохраняют таблицы в TrendingScore, откуда они поднимаются, если
+кэш их вытеснил.
+"""
+import heapq
+import math
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.cache import locked
+
+from .models import TrendingScore
+
+HALF_LIFE = 6 * 60 * 60
+CAPACITY = 100
+TOP = 5
+POST_WEIGHT = 1.0
+COMMENT_WEIGHT = 0.5
+KINDS = ('posts', 'groups', 'authors')
+TRENDING_KEY = 'trending:{}'
+TRENDING_TIMEOUT = None
+LOCK_KEY = 'trending:lock'
+LOCK_WAIT = 10
+CHECKPOINT_INTERVAL = 5 * 60
+
+_RATE = math.log(2) / HALF_LIFE
+
+
+def _log_add(a, b):
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def _table(kind):
+    table = cache.get(TRENDING_KEY.format(kind))
+    if table is None:
+        table = dict(
+            TrendingScore.objects.filter(kind=kind)
+            .values_list('object_id', 'score')
+        )
+        cache.set(TRENDING_KEY.format(kind), table, TRENDING_TIMEOUT)
+    return table
+
+
+def _add(table, object_id, weight, now):
+    value = math.log(weight) + now * _RATE
+    if object_id in table:
+        value = _log_add(table[object_id], value)
+    table[object_id] = value
+    if len(table) > CAPACITY:
+        del table[min(table, key=table.get)]
+
+
+def record(events):
+    """Применяет события (вид, id, вес, момент) одной записью в кэш."""
+    events = [event for event in events if event[1] is not None]
+    if not events:
+        return
+    now = time.time()
+    with locked(LOCK_KEY, LOCK_WAIT):
+        tables = {kind: _table(kind) for kind, *_ in events}
+        for kind, object_id, weight, at in events:
+            _add(tables[kind], object_id, weight, now if at is None else at)
+        cache.set_many({
+            TRENDING_KEY.format(kind): table
+            for kind, table in tables.items()
+        }, TRENDING_TIMEOUT)
+
+
+def bump(kind, object_id, weight, now=None):
+    """Добавляет объекту вес, затухающий начиная с момента now."""
+    record([(kind, object_id, weight, now)])
+
+
+def events(post, weight, now=None):
+    """События поста, его группы и автора."""
+    return [
+        ('posts', post.id, weight, now),
+        ('groups', post.group_id, weight, now),
+        ('authors', post.author_id, weight, now),
+    ]
+
+
+def record_post(post, now=None):
+    record(events(post, POST_WEIGHT, now))
+
+
+def record_comment(post, now=None):
+    """Комментарий к посту post."""
+    record(events(post, COMMENT_WEIGHT, now))
+
+
+def top_ids(kind, k=TOP):
+    table = _table(kind)
+    return heapq.nlargest(k, table, key=table.get)
+
+
+def top(kind, queryset, k=TOP):
+    """Объекты queryset в порядке убывания счёта; удалённые пропускаются."""
+    ids = top_ids(kind, k)
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def checkpoint():
+    """Сохраняет текущие таблицы в базу."""
+    with locked(LOCK_KEY, LOCK_WAIT), transaction.atomic():
+        for kind in KINDS:
+            TrendingScore.objects.filter(kind=kind).delete()
+            TrendingScore.objects.bulk_create(
+                TrendingScore(kind=kind, object_id=pk, score=score)
+                for pk, score in _table(kind).items()
+            )
@@ -16,6 +16,16 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/',
+        views.comment_thread,
+        name='comment_thread'
+    ),
+    path(
+        'posts/<int:post_id>/react/',
+        views.post_react,
+        name='post_react'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
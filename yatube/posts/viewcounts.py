@@ -0,0 +1,93 @@
+"""Счётчик просмотров постов без записи в базу на каждый просмотр.
+
+Просмотры копятся в памяти процесса (core.counters) и раз в
+VIEWS_FLUSH_INTERVAL секунд записываются одним UPDATE ... CASE на
+пачку постов. Пока ключей меньше VIEWS_MAX_PENDING, ничего не теряется,
+кроме несброшенного остатка при аварийном завершении процесса.
+При переполнении по умолчанию (VIEWS_OVERFLOW = 'drop') просмотры
+новых постов отбрасываются, чтобы не задерживать ответ; 'flush'
+вместо этого сбрасывает пачку прямо в запросе.
+
+Повторные просмотры одной сессией за VIEWS_DEDUP_TTL секунд не
+считаются. Множество просмотренных пар (сессия, пост) живёт в памяти
+процесса и ограничено VIEWS_DEDUP_SIZE записями: самые старые
+вытесняются, а просмотр той же сессией в другом воркере засчитается
+ещё раз. Сессии при этом не меняются и в базу не пишутся.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from core.counters import DROP, BufferedCounter
+
+from .models import Post
+
+FLUSH_CHUNK = 300
+
+
+def flush(deltas):
+    items = list(deltas.items())
+    with transaction.atomic():
+        # Ограничение SQLite на число параметров в запросе.
+        for start in range(0, len(items), FLUSH_CHUNK):
+            chunk = dict(items[start:start + FLUSH_CHUNK])
+            Post.objects.filter(pk__in=chunk).update(
+                views=F('views') + Case(
+                    *[When(pk=pk, then=Value(delta))
+                      for pk, delta in chunk.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ))
+
+
+buffer = BufferedCounter(
+    flush,
+    interval=getattr(settings, 'VIEWS_FLUSH_INTERVAL', 5),
+    max_keys=getattr(settings, 'VIEWS_MAX_PENDING', 10000),
+    overflow=getattr(settings, 'VIEWS_OVERFLOW', DROP),
+)
+
+
+class RecentViews:
+    """Ограниченное множество недавних пар (сессия, пост)."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def first_view(self, key):
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen < self.ttl:
+                return False
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.size:
+                self._seen.popitem(last=False)
+            return True
+
+
+recent = RecentViews(
+    size=getattr(settings, 'VIEWS_DEDUP_SIZE', 100000),
+    ttl=getattr(settings, 'VIEWS_DEDUP_TTL', 60 * 30),
+)
+
+
+def record(request, post):
+    session_key = request.session.session_key
+    if (getattr(settings, 'VIEWS_DEDUP_SESSIONS', True) and session_key
+            and not recent.first_view((session_key, post.pk))):
+        return
+    buffer.add(post.pk)
+
+
+def views(post):
+    """Просмотры из базы плюс ещё не сброшенные этим процессом."""
+    return post.views + buffer.get(post.pk)
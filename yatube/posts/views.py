@@ -1,12 +1,26 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
 
+from core.loader import for_request
+
+from . import (cached, follow_feed, follow_graph, front_page, reactions,
+               trending, viewcounts)
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post
+from .models import (Comment, Follow, Group, Post, Reaction,
+                     Recommendation)
 
 AMOUNT = 10
+SUGGESTIONS = 5
+# Сколько уровней ответов показывать сразу; глубже — по ссылке.
+COMMENT_DEPTH = 3
+
+
+def feed_engine():
+    return getattr(settings, 'FEED_TEMPLATE_ENGINE', 'django')
 
 
 def pag(request, post_list):
@@ -16,22 +30,65 @@ def pag(request, post_list):
     return page_obj
 
 
+def suggestions(user):
+    """Заранее рассчитанные рекомендации авторов для пользователя."""
+    return Recommendation.objects.filter(
+        user=user, author__is_active=True,
+    ).select_related('author')[:SUGGESTIONS]
+
+
+def comment_tree(comments, root_depth):
+    """Отступы и признак свёрнутого поддерева для шаблона."""
+    cut = root_depth + COMMENT_DEPTH - 1
+    comments = list(comments)
+    for comment in comments:
+        comment.indent = comment.depth - root_depth
+        comment.collapsed = comment.depth == cut and comment.descendants > 0
+    return comments
+
+
+def trending_context():
+    """Трендовые разделы; запросы выполняются только при отрисовке."""
+    return {
+        'trending_posts': SimpleLazyObject(
+            lambda: trending.top('posts', Post.visible.all())),
+        'trending_groups': SimpleLazyObject(
+            lambda: trending.top(
+                'groups', Group.objects.filter(hidden=False))),
+        'top_authors': SimpleLazyObject(
+            lambda: trending.top(
+                'authors', User.objects.filter(is_active=True))),
+    }
+
+
+def follow_marks(user):
+    """Подписки для кнопок в общем для всех фрагменте ленты."""
+    if not user.is_authenticated:
+        return None
+    return {'me': user.pk, 'following': list(follow_graph.following(user.pk))}
+
+
 def index(request):
     """Главная страница."""
     title = 'Последние обновления на сайте'
-    post_list = Post.objects.select_related('group', 'author')
+    post_list = front_page.posts(
+        Post.visible.hot().select_related('group', 'author'))
     page_obj = pag(request, post_list)
     context = {
         'title': title,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'follow_marks': follow_marks(request.user),
+        **trending_context(),
     }
-    return render(request, 'posts/index.html', context)
+    return render(
+        request, 'posts/index.html', context, using=feed_engine())
 
 
 def group_posts(request, slug):
     """Страница со списком групп."""
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.groups_post.select_related('group', 'author')
+    group = cached.group_or_404(slug)
+    post_list = Post.visible.filter(group=group).hot().select_related(
+        'group', 'author')
     page_obj = pag(request, post_list)
     title = f'Записи сообщества {group}'
     context = {
@@ -39,45 +96,77 @@ def group_posts(request, slug):
         'title': title,
         'page_obj': page_obj
     }
-    return render(request, 'posts/group_list.html', context)
+    return render(
+        request, 'posts/group_list.html', context, using=feed_engine())
 
 
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = user.posts.select_related('group', 'author')
+    user = cached.user_or_404(username)
+    post_list = Post.visible.filter(author=user).select_related(
+        'group', 'author')
     page_obj = pag(request, post_list)
+    loader = for_request(request)
+    context = {
+        'author': user,
+        'page_obj': page_obj,
+        'posts_count': loader.load('posts_count', user.pk),
+        'followers_count': loader.load('followers_count', user.pk),
+    }
     if request.user.is_authenticated:
-        following = Follow.objects.filter(user=request.user, author=user)
-        context = {
-            'author': user,
-            'page_obj': page_obj,
-            'posts_count': user.posts.count(),
-            'following': following,
-        }
-    else:
-        context = {
-            'author': user,
-            'page_obj': page_obj,
-            'posts_count': user.posts.count(),
-        }
-    return render(request, 'posts/profile.html', context)
+        context['following'] = loader.load('following', user.pk)
+        context['suggestions'] = suggestions(request.user)
+    return render(
+        request, 'posts/profile.html', context, using=feed_engine())
 
 
 def post_detail(request, post_id):
     posts = get_object_or_404(
-        Post.objects.select_related('author', 'group'), id=post_id)
-    posts_count = posts.author.posts.count()
-    comments = Comment.objects.filter(post=posts)
+        Post.visible.select_related('author', 'group'), id=post_id)
+    posts_count = for_request(request).load('posts_count', posts.author_id)
+    comments = Comment.objects.thread(
+        posts, max_depth=COMMENT_DEPTH - 1).select_related('author')
+    reply_to = None
+    reply = request.GET.get('reply', '')
+    if reply.isdigit():
+        reply_to = Comment.objects.filter(
+            pk=reply, post=posts).select_related('author').first()
     form = CommentForm()
+    reactions.attach([posts])
+    viewcounts.record(request, posts)
     context = {
         'posts': posts,
         'posts_count': posts_count,
+        'views': viewcounts.views(posts),
         'form': form,
-        'comments': comments,
+        'comments': comment_tree(comments, 0),
+        'reply_to': reply_to,
     }
+    if request.user.is_authenticated:
+        mine = Reaction.objects.filter(
+            user=request.user, post=posts).values_list('kind', flat=True)
+        mine = next(iter(mine), None)
+        counts = {kind: count for kind, _, count in posts.reaction_counts}
+        context['reaction_buttons'] = [
+            (kind, label, counts.get(kind, 0), kind == mine)
+            for kind, label in reactions.KINDS
+        ]
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_thread(request, post_id, comment_id):
+    """Поддерево комментария, не поместившееся на странице поста."""
+    post = get_object_or_404(Post.visible, id=post_id)
+    root = get_object_or_404(Comment, pk=comment_id, post=post)
+    comments = Comment.objects.subtree(
+        root, max_depth=COMMENT_DEPTH - 1).select_related('author')
+    context = {
+        'post': post,
+        'root': root,
+        'comments': comment_tree(comments, root.depth),
+    }
+    return render(request, 'posts/comment_thread.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -95,7 +184,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.visible, id=post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
@@ -116,40 +205,65 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.visible, id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        # Родитель передаётся скрытым полем вне формы: форма
+        # комментария по-прежнему состоит из одного поля text.
+        parent = request.POST.get('parent', '')
+        if parent.isdigit():
+            comment.parent = Comment.objects.filter(
+                pk=parent, post=post).first()
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@login_required
+def post_react(request, post_id):
+    post = get_object_or_404(Post.visible, id=post_id)
+    kind = request.POST.get('kind')
+    if request.method == 'POST' and kind in dict(reactions.KINDS):
+        reactions.toggle(request.user, post, kind)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = pag(request, post_list)
+    author_ids = follow_graph.following(request.user.id)
+    if getattr(settings, 'FOLLOW_FEED_ENGINE', 'sql') == 'merge':
+        page_obj = follow_feed.page(
+            author_ids,
+            follow_feed.parse_cursor(request.GET.get('cursor')),
+            AMOUNT,
+        )
+    else:
+        post_list = Post.visible.filter(
+            author_id__in=author_ids
+        ).select_related('group', 'author')
+        page_obj = pag(request, post_list)
     context = {
         'page_obj': page_obj,
+        'suggestions': suggestions(request.user),
     }
-    return render(request, 'posts/follow.html', context)
+    return render(
+        request, 'posts/follow.html', context, using=feed_engine())
 
 
 @login_required
 def profile_follow(request, username):
     user = request.user
-    author = get_object_or_404(User, username=username)
-    is_follower = Follow.objects.filter(user=user, author=author)
-    if user != author and not is_follower.exists():
+    author = cached.user_or_404(username)
+    if user != author and not follow_graph.is_following(user.id, author.id):
         Follow.objects.create(user=user, author=author)
     return redirect('posts:profile', username=request.user.username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follower = Follow.objects.filter(user=request.user, author=author)
-    if follower.exists():
-        follower.delete()
+    author = cached.user_or_404(username)
+    if follow_graph.is_following(request.user.id, author.id):
+        Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=author)
@@ -0,0 +1,71 @@
+"""Пользователь из сессии без запроса к базе.
+
+Повторяет django.contrib.auth.get_user, но объект пользователя берёт
+из кэша. Запись сбрасывается при любом сохранении пользователя
+(смена пароля, правка профиля, вход) и при выходе.
+
+В общий кэш кладутся только поля CACHED_FIELDS и хеш сессии, без
+хеша пароля. Восстановленный пользователь догружает остальные поля
+из базы при первом обращении к ним (отложенные поля Django).
+"""
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 _get_user_session_key, get_user_model,
+                                 load_backend)
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import router
+from django.utils.crypto import constant_time_compare
+
+USER_KEY = 'auth_user:v2:{}'
+USER_TIMEOUT = 60 * 15
+CACHED_FIELDS = (
+    'id', 'username', 'first_name', 'last_name', 'is_active', 'is_staff',
+    'is_superuser',
+)
+
+
+def to_cache(user):
+    """Поля пользователя для общего кэша."""
+    return {name: getattr(user, name) for name in CACHED_FIELDS}
+
+
+def from_cache(data):
+    """Пользователь из to_cache; прочие поля загрузятся по обращению."""
+    User = get_user_model()
+    # from_db ждёт значения в порядке полей модели.
+    names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in data
+    ]
+    return User.from_db(
+        router.db_for_read(User), names, [data[name] for name in names])
+
+
+def invalidate(user_id):
+    cache.delete(USER_KEY.format(user_id))
+
+
+def get_user(request):
+    try:
+        user_id = _get_user_session_key(request)
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    key = USER_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        user = load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return AnonymousUser()
+        entry = (to_cache(user), user.get_session_auth_hash())
+        cache.set(key, entry, USER_TIMEOUT)
+    else:
+        user = from_cache(entry[0])
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, entry[1])):
+        request.session.flush()
+        return AnonymousUser()
+    return user
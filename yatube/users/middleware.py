@@ -0,0 +1,20 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from . import auth_cache
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = auth_cache.get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, который берёт пользователя из кэша."""
+
+    def process_request(self, request):
+        assert hasattr(request, 'session'), (
+            'CachedAuthenticationMiddleware требует SessionMiddleware.'
+        )
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from users import auth_cache
+
+User = get_user_model()
+
+
+class CachedAuthenticationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_user_and_session_from_cache(self):
+        """Повторный запрос не читает сессию и пользователя из базы."""
+        url = reverse('about:author')
+        self.authorized_client.get(url)
+        with self.assertNumQueries(0):
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_user_change_invalidates(self):
+        """Сохранение пользователя сбрасывает его запись в кэше."""
+        url = reverse('about:author')
+        self.authorized_client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Пётр'
+        user.save()
+        self.assertIsNone(cache.get(auth_cache.USER_KEY.format(user.pk)))
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['user'].first_name, 'Пётр')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """После смены пароля старая сессия перестаёт действовать."""
+        url = reverse('about:author')
+        self.authorized_client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('новый-пароль-123')
+        user.save()
+        response = self.authorized_client.get(url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_logout_invalidates(self):
+        """Выход сбрасывает пользователя из кэша."""
+        self.authorized_client.get(reverse('about:author'))
+        self.authorized_client.get(reverse('users:logout'))
+        self.assertIsNone(
+            cache.get(auth_cache.USER_KEY.format(self.user.pk)))
+
+    def test_password_hash_not_cached(self):
+        """В общий кэш не попадает хеш пароля."""
+        self.authorized_client.get(reverse('about:author'))
+        fields, _ = cache.get(auth_cache.USER_KEY.format(self.user.pk))
+        self.assertNotIn('password', fields)
+
+    def test_password_change_with_cached_user(self):
+        """Смена пароля проверяет старый пароль, догрузив его из базы."""
+        user = User.objects.create_user(
+            username='writer', password='старый-пароль-123')
+        client = Client()
+        client.force_login(user)
+        client.get(reverse('about:author'))
+        response = client.post(reverse('password_change'), {
+            'old_password': 'старый-пароль-123',
+            'new_password1': 'новый-пароль-456',
+            'new_password2': 'новый-пароль-456',
+        })
+        self.assertRedirects(response, reverse('password_change_done'))
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('новый-пароль-456'))
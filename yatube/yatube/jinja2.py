@@ -0,0 +1,95 @@
+"""Окружение Jinja2 для шаблонов лент (templates/jinja2).
+
+Шаблоны лент перенесены из Django-шаблонов один к одному и дают тот
+же HTML: значения экранируются функцией Django (finalize), а тег
+cache использует тот же ключ фрагмента и то же фоновое обновление,
+что и core.templatetags.coalesced_cache, поэтому фрагменты и
+карточки в кэше общие для обоих движков. Движок лент выбирается
+настройкой FEED_TEMPLATE_ENGINE.
+"""
+import logging
+
+from django.core.cache.utils import make_template_fragment_key
+from django.template import defaultfilters
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import escape, json_script
+from django.utils.timezone import template_localtime
+from jinja2 import Environment, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sorl.thumbnail import get_thumbnail
+
+from core.cache import get_or_set
+from core.templatetags.user_filters import addclass
+from posts.templatetags.post_cards import with_cards
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 20, 'index_page', page_obj.number %} ... {% endcache %}"""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache', [nodes.List(args)]), [], [], body,
+        ).set_lineno(lineno)
+
+    def _cache(self, args, caller):
+        timeout, name, *vary_on = args
+        return Markup(get_or_set(
+            make_template_fragment_key(name, vary_on),
+            caller,
+            None if timeout is None else int(timeout),
+            stale_while_revalidate=True,
+        ))
+
+
+def url(view_name, *args, **kwargs):
+    return reverse(view_name, args=args or None, kwargs=kwargs or None)
+
+
+def thumbnail(file_, geometry, **options):
+    """Миниатюра как у тега thumbnail из sorl; None — показывать нечего."""
+    if not file_:
+        return None
+    try:
+        return get_thumbnail(file_, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось сделать миниатюру')
+        return None
+
+
+def date(value, arg=None):
+    return defaultfilters.date(template_localtime(value), arg)
+
+
+def finalize(value):
+    """Экранирование как в Django-шаблонах (&quot;, а не &#34;)."""
+    if hasattr(value, '__html__'):
+        return value
+    return Markup(escape(value))
+
+
+def environment(**options):
+    options.setdefault('extensions', []).append(FragmentCacheExtension)
+    env = Environment(finalize=finalize, **options)
+    env.globals.update({
+        'static': static,
+        'url': url,
+        'thumbnail': thumbnail,
+    })
+    env.filters.update({
+        'addclass': addclass,
+        'date': date,
+        'json_script': json_script,
+        'truncatechars': defaultfilters.truncatechars,
+        'with_cards': with_cards,
+    })
+    return env
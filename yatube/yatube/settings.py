@@ -51,12 +51,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.staticfiles.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.loader.LoaderMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -73,6 +75,21 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.loader.loader',
+            ],
+        },
+    },
+    {
+        # Шаблоны лент для Jinja2, см. FEED_TEMPLATE_ENGINE.
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [os.path.join(BASE_DIR, 'templates', 'jinja2')],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'environment': 'yatube.jinja2.environment',
+            'context_processors': [
+                'django.contrib.auth.context_processors.auth',
+                'core.context_processors.year.year',
+                'core.context_processors.loader.loader',
             ],
         },
     },
@@ -130,6 +147,9 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# collectstatic: хеши в именах, манифест и сжатые копии .gz/.br
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
@@ -137,8 +157,51 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Префикс internal-location в nginx: тело медиафайлов отдаёт он
+# по заголовку X-Accel-Redirect. None — отдавать из Django.
+MEDIA_ACCEL_REDIRECT = None
+# Общий для всех воркеров кэш в файле SQLite (core.sqlite_cache)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
+# Сессии читаются из кэша и пишутся в базу только при изменении
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Фоновое обновление устаревших ключей кэша (core.cache)
+CACHE_REFRESH_WORKERS = 4
+CACHE_REFRESH_QUEUE = 100
+# False — фоновые задачи (core.jobs) выполняет только воркер
+# `manage.py runjobs`; без него не обновляются карточки после смены
+# имени автора или группы, буфер главной, тренды, миниатюры и не идёт
+# фоновое удаление. True — задачи выполняются сразу, без воркера.
+JOBS_EAGER = False
+# Как часто (в секундах) сбрасывать накопленные счётчики реакций
+REACTIONS_FLUSH_INTERVAL = 5
+# Счётчик просмотров постов (posts.viewcounts): период сброса в базу,
+# предел несброшенных постов и что делать сверх него ('drop' —
+# не считать, 'flush' — сбросить в запросе), дедупликация по сессии
+VIEWS_FLUSH_INTERVAL = 5
+VIEWS_MAX_PENDING = 10000
+VIEWS_OVERFLOW = 'drop'
+VIEWS_DEDUP_SESSIONS = True
+VIEWS_DEDUP_TTL = 60 * 30
+VIEWS_DEDUP_SIZE = 100000
+# Посты старше стольких дней команда archive_posts убирает из лент
+# (главная и группы); в профиле и по прямой ссылке они остаются
+ARCHIVE_AFTER_DAYS = 365
+# Лента подписок: 'sql' — запрос с JOIN и номерами страниц,
+# 'merge' — слияние кэшированных потоков авторов (posts.follow_feed)
+FOLLOW_FEED_ENGINE = 'sql'
+# Сколько новейших постов главной каждый процесс держит в памяти
+# (posts.front_page); 0 — читать главную только из базы
+INDEX_BUFFER_SIZE = 100
+# Перед удалением тестовой базы выбрасывает несброшенные счётчики
+TEST_RUNNER = 'core.test_runner.TestRunner'
+# Чем рисовать ленты (главная, группа, профиль, подписки) и карточки
+# постов: 'django' или 'jinja2' (шаблоны в templates/jinja2)
+FEED_TEMPLATE_ENGINE = 'django'